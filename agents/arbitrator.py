@@ -1,8 +1,10 @@
 # agents/arbitrator.py
+import asyncio
 from langchain_core.messages import HumanMessage
 from schemas.state import AgentState
 from tools.tool_pool import tool_pool
 from utils.logger import get_logger, log_execution
+from utils.prompt_cache import cacheable_prompt, response_usage, cache_hit_rate
 from config import settings
 
 logger = get_logger(__name__)
@@ -17,32 +19,57 @@ class ArbitratorAgent:
     def make_verdict(self, state: AgentState) -> dict:
         """Arbitration Node - Make the Final Verdict"""
         logger.info("Starting final verdict generation")
-        
-        # Prepare debate history summary
-        debate_summary = "\n".join([f"{msg.content}" for msg in state["debate_history"]])
-
-        # Generate risk assessment report
-        report_prompt = [
-            HumanMessage(content=settings.PROMPT_TEMPLATES["arbitrator_prompt"].format(
-                            instruction=state['instruction'],
-                            raw_input=state['raw_input'],
-                            translated_text=state['translated_text'],
-                            background=state['background'],
-                            debate_summary=debate_summary
-                        ))
-                                        ]
-        
-        logger.debug("Report prompt length: %d", len(report_prompt[0].content))
-        
+
+        report_prompt = self._build_report_prompt(state)
+
         # Get the final report
         response = self.llm.invoke(report_prompt)
         report_content = response.content
-        
+
         # Check if tool verification is needed
         if "Tool Verification:" in report_content:
             tool_result = self._verify_with_tools(report_content, state)
             report_content += f"\n\nTool Verification Result:\n{tool_result}"
-        
+
+        return self._build_verdict(report_content, response_usage(response))
+
+    @log_execution()
+    async def amake_verdict(self, state: AgentState) -> dict:
+        """Arbitration Node - Make the Final Verdict (async)"""
+        logger.info("Starting final verdict generation")
+
+        report_prompt = self._build_report_prompt(state)
+
+        response = await self.llm.ainvoke(report_prompt)
+        report_content = response.content
+
+        if "Tool Verification:" in report_content:
+            tool_result = await asyncio.to_thread(self._verify_with_tools, report_content, state)
+            report_content += f"\n\nTool Verification Result:\n{tool_result}"
+
+        return self._build_verdict(report_content, response_usage(response))
+
+    def _build_report_prompt(self, state: AgentState) -> list:
+        """Build the arbitration prompt: shared case prefix + debate turns + arbitration task
+
+        The debate turns are passed as the same messages the debaters saw, so the
+        arbitration call reuses the prefix cached during the debate.
+        """
+        history = list(state["debate_history"])
+        triage = state.get("triage") or {}
+        if not history and triage.get("label"):
+            # The planner routed this item straight to arbitration
+            history = [HumanMessage(content=(
+                f"No debate was held. Triage assessment: {triage['label']} "
+                f"(confidence {triage['confidence']:.2f}). {triage['reason']}"
+            ))]
+        report_prompt = cacheable_prompt(state, history, settings.PROMPT_TEMPLATES["arbitrator_task"])
+
+        logger.debug("Report prompt length: %d", sum(len(msg.content) for msg in report_prompt))
+        return report_prompt
+
+    def _build_verdict(self, report_content: str, usage: dict) -> dict:
+        """Extract the risk decision from the report"""
         # Extract risk decision
         # risk_decision = "Yes" if "Risk exists:Yes" in report_content else "No"
         if "## Risk Exists:" in report_content:
@@ -55,16 +82,19 @@ class ArbitratorAgent:
                     break
                 else:
                     risk_decision = "No" # Default value
-        
+
         logger.info("Risk assessment completed, decision: %s", risk_decision)
         logger.debug("Report summary: %s", report_content[:200] + "...")
-        
+        logger.info("Arbitration prompt cache hit %d/%d tokens (%.1f%%)", usage["cached_tokens"],
+                    usage["prompt_tokens"], 100 * cache_hit_rate(usage))
+
         return {
             "verdict": {
                 "decision": risk_decision,
                 "report": report_content,  
                 "risk_decision": risk_decision,
             },
+            "token_usage": usage,
             "status": "completed"
         }
 
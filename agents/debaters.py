@@ -1,17 +1,14 @@
 # agents/debaters.py
-from dataclasses import dataclass
 from langchain_core.messages import HumanMessage
 from schemas.state import AgentState
+from schemas.debate import ConvergenceDetector, DebateLog, DebateTurn
 from tools.tool_pool import tool_pool
 from utils.logger import get_logger, log_execution
+from utils.prompt_cache import cacheable_prompt, response_usage, merge_usage, cache_hit_rate
 from config import settings
 logger = get_logger(__name__)
 
 
-@dataclass
-class DebateTurn:
-    role: str  # "strict" or "lenient"
-    content: str
 class DebaterAgent:
     def __init__(self):       
         self.llm = settings.get_llm("debaters")
@@ -30,12 +27,9 @@ class DebaterAgent:
         - 对齐者（aligner）负责检查辩论者提及的**非文本模态**信息，决定是否调用工具验证。
         - 若对齐者经验证后认为辩论者描述不正确，会给出纠正意见，触发该辩论者在本轮重做（最多 self.MAX_CORRECTIONS 次）。
         """
-        from config import settings
-
-        logger.info("开始辩论环节，计划轮数: %d", settings.DEBATE_ROUNDS)
-
-        # 定义辩论角色 - 严格标准和宽松标准
-        debaters = settings.PROMPT_TEMPLATES["debaters_role"]
+        debaters = self._prepare_debate(state)
+        detector = self._new_detector(debaters)
+        usage = {}
 
         # 对齐者角色
         aligner_role = {
@@ -44,58 +38,22 @@ class DebaterAgent:
 
         }
 
-        # 确保辩论历史存在
-        if "debate_history" not in state:
-            state["debate_history"] = []
-        if "end" not in state:
-            state["end"] = False
-
         # 进行多轮辩论
         for round_num in range(1, settings.DEBATE_ROUNDS + 1):
             logger.info("开始第 %d/%d 轮辩论", round_num, settings.DEBATE_ROUNDS)
             if state["end"]:
                 break
 
+            if round_num == 1 and settings.DEBATE_PARALLEL_OPENING:
+                responses = self.llm.batch(self._opening_prompts(state, debaters))
+                usage = merge_usage(usage, self._record_opening(state, debaters, responses, detector))
+                continue
+
             for debater in debaters:
                 logger.debug("准备 %s 的辩论观点", debater["name"])
                 if state["end"]:
                     break
                 
-                # 获取对方上一次的发言（如果有）
-                opponent_turn = None
-                self_turn = None
-
-                # if state["debate_history"]:
-                #     # 查找对方上一次发言
-                #     for msg in reversed(state["debate_history"]):
-                #         if isinstance(msg, HumanMessage) and debater["name"] not in msg.content:
-                #             # 提取对方发言内容
-                #             content_parts = msg.content.split(":", 1)
-                #             if len(content_parts) > 1:
-                #                 opponent_turn = DebateTurn(
-                #                     role="strict" if "严格" in content_parts[0] else "lenient",
-                #                     content=content_parts[1].strip()
-                #                 )
-                #             break
-                
-                for msg in reversed(state["debate_history"]):
-                    if isinstance(msg, HumanMessage):
-                        content_parts = msg.content.split(":", 1)
-                        if len(content_parts) > 1:
-                            role = "strict" if "strict" in content_parts[0].lower() else "lenient"
-                            content = content_parts[1].strip()
-                            turn = DebateTurn(role=role, content=content)
-                            # 判断发言方：根据 debater["name"] 是否在前缀里区分
-                            if debater["name"] not in content_parts[0]:
-                                if opponent_turn is None:
-                                    opponent_turn = turn
-                            else:
-                                if self_turn is None:
-                                    self_turn = turn
-                        # 如果两个都已找到，就可以提前终止遍历
-                        if opponent_turn and self_turn:
-                            break
-
                 # 每个角色可能需要被对齐者要求重做多次
                 attempt = 0
                 while attempt < self.MAX_CORRECTIONS:
@@ -106,13 +64,13 @@ class DebaterAgent:
                     logger.debug("%s 第%d轮 第%d次尝试", debater["name"], round_num, attempt)
 
                     # 构建辩论提示
-                    prompt = self._build_debater_prompt(
-                        debater, state, round_num, opponent_turn
-                    )
+                    prompt = self._build_debater_prompt(debater, state, round_num)
                     
                     # 获取辩论观点（辩论者不能也不应调用工具）
                     response = self.llm.invoke(prompt)
                     debate_content = response.content
+                    turn_usage = response_usage(response)
+                    usage = merge_usage(usage, turn_usage)
 
 
                     # # 如果辩论者文本中包含工具调用指令，直接忽略以防误用
@@ -122,19 +80,8 @@ class DebaterAgent:
                     #         [line for line in debate_content.split('\n') if '使用工具:' not in line]
                     #     )
 
-                    # 将对齐者之前的反馈（如果有）从历史中移除，以便添加更新后的版本
-                    if attempt > 1 and state["debate_history"] and "对齐者" in state["debate_history"][-1].content:
-                        state["debate_history"].pop()
-                    
-                    # 添加辩论者观点到历史
-                    new_message = HumanMessage(
-                        content=f"===={debater['name']} Round {round_num} viewpoint:====\n {debate_content}\n"
-                    )
-
-                    state["debate_history"].append(new_message)
-                    
-                    if "I agree with your viewpoint" in debate_content:
-                        state["end"] = True
+                    if self._record_turn(state, debater, round_num, attempt, debate_content,
+                                         turn_usage["completion_tokens"], detector):
                         break
 
                     # 对齐者检查（对齐者可以选择是否调用工具检查非文本模态内容）
@@ -171,55 +118,145 @@ class DebaterAgent:
                     # logger.debug("%s 第%d轮确认完成（attempt=%d）", debater["name"], round_num, attempt)
                     # break
 
-        logger.info("辩论完成，总辩论记录数: %d", len(state.get("debate_history", [])))
+        return self._finish_debate(state, usage, detector, len(debaters))
+    
+    @log_execution()
+    async def adebate(self, state: AgentState) -> dict:
+        """辩论节点（异步版本），流程与 debate 一致"""
+        debaters = self._prepare_debate(state)
+        detector = self._new_detector(debaters)
+        usage = {}
+
+        for round_num in range(1, settings.DEBATE_ROUNDS + 1):
+            logger.info("开始第 %d/%d 轮辩论", round_num, settings.DEBATE_ROUNDS)
+            if state["end"]:
+                break
+
+            if round_num == 1 and settings.DEBATE_PARALLEL_OPENING:
+                responses = await self.llm.abatch(self._opening_prompts(state, debaters))
+                usage = merge_usage(usage, self._record_opening(state, debaters, responses, detector))
+                continue
+
+            for debater in debaters:
+                logger.debug("准备 %s 的辩论观点", debater["name"])
+                if state["end"]:
+                    break
+
+                attempt = 0
+                while attempt < self.MAX_CORRECTIONS:
+                    if state["end"]:
+                        break
 
+                    attempt += 1
+                    logger.debug("%s 第%d轮 第%d次尝试", debater["name"], round_num, attempt)
+
+                    prompt = self._build_debater_prompt(debater, state, round_num)
+                    response = await self.llm.ainvoke(prompt)
+                    debate_content = response.content
+                    turn_usage = response_usage(response)
+                    usage = merge_usage(usage, turn_usage)
+
+                    if self._record_turn(state, debater, round_num, attempt, debate_content,
+                                         turn_usage["completion_tokens"], detector):
+                        break
+
+        return self._finish_debate(state, usage, detector, len(debaters))
+
+    def _opening_prompts(self, state, debaters) -> list:
+        """第一轮各角色的提示，均只包含共用前缀（彼此看不到对方的开场陈述）"""
+        return [self._build_debater_prompt(debater, state, 1) for debater in debaters]
+
+    def _record_opening(self, state, debaters, responses, detector) -> dict:
+        """按角色顺序写入并发生成的开场陈述，返回 token 用量
+
+        开场陈述已全部生成，即使前面的发言触发收敛也全部写入历史。
+        """
+        usage = {}
+        for debater, response in zip(debaters, responses):
+            turn_usage = response_usage(response)
+            usage = merge_usage(usage, turn_usage)
+            self._record_turn(state, debater, 1, 1, response.content,
+                              turn_usage["completion_tokens"], detector)
+        logger.info("第1轮 %d 个角色的开场陈述已并发生成", len(debaters))
+        return usage
+
+    def _new_detector(self, debaters) -> ConvergenceDetector:
+        return ConvergenceDetector(
+            n_roles=len(debaters),
+            enabled=settings.DEBATE_CONVERGENCE,
+            min_rounds=settings.DEBATE_MIN_ROUNDS,
+            repeat_threshold=settings.DEBATE_REPEAT_THRESHOLD,
+        )
+
+    def _finish_debate(self, state, usage, detector, n_roles) -> dict:
+        debate_log = state["debate_log"]
+        logger.info("辩论完成，总辩论记录数: %d", len(debate_log))
+        debate_stats = {
+            "rounds_run": detector.rounds,
+            "rounds_saved": settings.DEBATE_ROUNDS - detector.rounds,
+            "turns_saved": settings.DEBATE_ROUNDS * n_roles - detector.turns,
+            "stop_reason": detector.stop_reason or "max_rounds",
+        }
+        if detector.stop_reason:
+            logger.info("辩论提前收敛（%s），节省 %d 次发言", detector.stop_reason, debate_stats["turns_saved"])
+        if usage:
+            logger.info("辩论 prompt 缓存命中 %d/%d tokens (%.1f%%)", usage["cached_tokens"],
+                        usage["prompt_tokens"], 100 * cache_hit_rate(usage))
+        # 辩论历史只在节点结束时渲染一次，供仲裁者与报告使用
         return {
+            "debate_log": debate_log,
+            "debate_history": debate_log.to_messages(),
+            "token_usage": usage,
+            "debate_stats": debate_stats,
             "status": "debate_completed"
         }
-    
-    def _build_debater_prompt(self, debater, state, round_num, opponent_turn):
-        """构建辩论者提示"""
-        # 基础提示
-        prompt_parts = [
-            f"Content Safety Risk Assessment Debate - Round {round_num}\n",
-            f"User Instruction:\n{state['instruction']}\n",
-            f"User Input:\n{state['translated_text']}\n",
-        ]
-        
-        # 添加背景信息（如果有）
-        if state.get('background'):
-            # prompt_parts.append(f"背景信息:\n{state['background']}\n（背景信息并非用户输入，仅供参考）\n")
-            prompt_parts.append(
-                f"Background Information:\n{state['background']}\n(This background information is not part of the user input and is for reference only)\n"
-            )
 
-        
-        # Add debater role and stance
-        prompt_parts.append(f"Your role: {debater['name']} ({debater['stance']})\n\n")
-
-        # Add debate history
-        if state["debate_history"]:
-            prompt_parts.append("Debate History:\n")
-            for msg in state["debate_history"][-6:]:  # Keep only the most recent few messages
-                if opponent_turn:
-                    opponent_name = "Strict Content Safety Reviewer" if opponent_turn.role == "strict" else "Content Safety Reviewer"
-                
-                content = msg.content
-                # content = content.replace(opponent_name, "Human")
-                
-                prompt_parts.append(f"{content}\n")
+    def _prepare_debate(self, state):
+        """初始化辩论状态，返回辩论角色列表"""
+        logger.info("开始辩论环节，计划轮数: %d", settings.DEBATE_ROUNDS)
 
-        
-        # 添加对手上一轮观点（如果有）
-        # if opponent_turn:
-        #     opponent_name = "严格标准审核员" if opponent_turn.role == "strict" else "宽松标准审核员"
-        #     # prompt_parts.append(f"\n对方上一轮观点: {opponent_name}: {opponent_turn.content}\n")
-        #     prompt_parts.append(f"\n人类上一轮观点:  {opponent_turn.content}\n")
-        
-        # 最终指令
-        prompt_parts.append(settings.PROMPT_TEMPLATES["debate_next"])
-        
-        return [HumanMessage(content="".join(prompt_parts))]
+        # 每次辩论使用新的辩论记录
+        state["debate_log"] = DebateLog()
+        if "end" not in state:
+            state["end"] = False
+
+        # 定义辩论角色 - 严格标准和宽松标准
+        return settings.PROMPT_TEMPLATES["debaters_role"]
+
+    def _record_turn(self, state, debater, round_num, attempt, debate_content, tokens, detector) -> bool:
+        """将辩论者观点写入辩论记录，若辩论已收敛则结束辩论并返回 True"""
+        state["debate_log"].append(DebateTurn(
+            role=debater["role"],
+            name=debater["name"],
+            round=round_num,
+            attempt=attempt,
+            text=debate_content,
+            tokens=tokens,
+        ))
+
+        if detector.observe(debater["role"], round_num, debate_content):
+            state["end"] = True
+            return True
+        return False
+
+    def _build_debater_prompt(self, debater, state, round_num):
+        """构建辩论者提示
+
+        共用前缀（指令、用户输入、背景）→ 逐条追加的辩论历史 → 本轮角色与指令，
+        轮次号和角色只出现在最后一条消息中，因此每次调用的前缀都是上一次调用的扩展，
+        可以命中提供方的前缀缓存。
+        """
+        # 按 token 预算保留最近的发言，对方的最新观点总会保留
+        history = state["debate_log"].history(debater["role"], settings.DEBATE_HISTORY_TOKENS)
+        suffix = (
+            f"Content Safety Risk Assessment Debate - Round {round_num}\n"
+            f"Your role: {debater['name']} ({debater['stance']})\n"
+            + settings.PROMPT_TEMPLATES["debate_next"]
+        )
+        if settings.DEBATE_CONVERGENCE:
+            # 收敛判定依赖每条发言末尾的风险标签
+            suffix += settings.PROMPT_TEMPLATES["debate_risk_label"]
+        return cacheable_prompt(state, history, suffix)
     
     def _get_aligner_feedback(self, aligner_role, debater, debate_content, state):
         """获取对齐者反馈"""
@@ -231,7 +268,7 @@ class DebaterAgent:
                 f"辩论者: {debater['name']}\n"
                 f"辩论者观点:\n{debate_content}\n"
             ))
-        ] + state["debate_history"][-5:]  # 只包含最近的历史
+        ] + state["debate_log"].to_messages(last=5)  # 只包含最近的历史
         
         aligner_response = self.aligner_llm.invoke(aligner_prompt)
         aligner_feedback = aligner_response.content
@@ -246,7 +283,7 @@ class DebaterAgent:
                 HumanMessage(content=(
                     f"这是工具返回的结果:\n{tool_result}\n\n请基于该工具结果，给出最终结论（是否存在模态描述错误）和具体的纠正建议。"
                 ))
-            ] + state["debate_history"][-3:]  # 只包含最近的历史
+            ] + state["debate_log"].to_messages(last=3)  # 只包含最近的历史
             
             second_align_resp = self.aligner_llm.invoke(followup_prompt)
             aligner_feedback = second_align_resp.content
@@ -1,26 +1,124 @@
 # agents/planner.py
+import threading
+import time
+from typing import Dict, Literal, Optional
+
+from pydantic import BaseModel, Field
+
 from schemas.state import AgentState
 from utils.logger import get_logger, log_execution
+from utils.prompt_cache import cacheable_prompt
+from config import settings
 
 logger = get_logger(__name__)
 
+
+class TriageDecision(BaseModel):
+    """Triage a content safety assessment before background retrieval and debate."""
+
+    label: Literal["safe", "unsafe", "ambiguous"] = Field(
+        description="safe / unsafe only when the case is clear-cut, otherwise ambiguous"
+    )
+    confidence: float = Field(ge=0, le=1, description="Confidence in the label, between 0 and 1")
+    reason: str = Field(description="One-sentence justification")
+
+
+class RouteStats:
+    """按路由统计条目数、分诊耗时与端到端耗时（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, latency: float, triage_latency: float = 0.0) -> None:
+        with self._lock:
+            stats = self._routes.setdefault(route, {"count": 0, "latency": 0.0, "triage_latency": 0.0})
+            stats["count"] += 1
+            stats["latency"] += latency
+            stats["triage_latency"] += triage_latency
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                route: {
+                    "count": s["count"],
+                    "avg_latency_s": round(s["latency"] / s["count"], 3),
+                    "avg_triage_ms": round(1000 * s["triage_latency"] / s["count"], 1),
+                }
+                for route, s in self._routes.items()
+            }
+
+
+route_stats = RouteStats()
+
+
 class PlannerAgent:
     def __init__(self):
-        from config import settings
         self.llm = settings.get_llm("planner")
+        self.triager = self.llm.with_structured_output(TriageDecision)
         logger.info("规划者智能体已初始化，使用模型: %s", self.llm.model_name)
 
     @log_execution()
     def plan(self, state: AgentState) -> dict:
-        """规划节点 - 定义工作流程"""
+        """规划节点 - 分诊后决定走完整的检索 + 辩论流程还是直接仲裁"""
+        logger.info("开始规划工作流程")
+        if not settings.PLANNER_TRIAGE:
+            return self._route(None, 0.0)
+
+        start = time.perf_counter()
+        decision = self._triage(state)
+        return self._route(decision, time.perf_counter() - start)
+
+    @log_execution()
+    async def aplan(self, state: AgentState) -> dict:
+        """规划节点（异步版本）"""
         logger.info("开始规划工作流程")
-        
-        # 实际应用中，这里可以根据内容复杂度添加更复杂的规划逻辑
-        next_step = "supporter"
-        
+        if not settings.PLANNER_TRIAGE:
+            return self._route(None, 0.0)
+
+        start = time.perf_counter()
+        decision = await self._atriage(state)
+        return self._route(decision, time.perf_counter() - start)
+
+    def _build_triage_prompt(self, state: AgentState) -> list:
+        # 复用辩论与仲裁的案例上下文模板，只为保持输入的表述一致。
+        # 分诊请求不会为后续调用预热提供方缓存：此时背景信息尚未生成，上下文内容不同；
+        # 结构化输出的 schema 也位于消息之前，请求前缀本身就不一样。
+        return cacheable_prompt(state, [], settings.PROMPT_TEMPLATES["planner_triage"])
+
+    def _triage(self, state: AgentState) -> Optional[TriageDecision]:
+        """结构化输出分诊；失败时返回 None（走完整流程）"""
+        try:
+            return self.triager.invoke(self._build_triage_prompt(state))
+        except Exception as e:
+            logger.warning("分诊失败，走完整流程: %s", e)
+            return None
+
+    async def _atriage(self, state: AgentState) -> Optional[TriageDecision]:
+        """_triage 的异步版本"""
+        try:
+            return await self.triager.ainvoke(self._build_triage_prompt(state))
+        except Exception as e:
+            logger.warning("分诊失败，走完整流程: %s", e)
+            return None
+
+    def _route(self, decision: Optional[TriageDecision], latency: float) -> dict:
+        """明确且置信度达到阈值的样本直接仲裁，其余走 supporter → debate"""
+        clear_cut = (
+            decision is not None
+            and decision.label != "ambiguous"
+            and decision.confidence >= settings.PLANNER_TRIAGE_THRESHOLD
+        )
+        next_step = "arbitrator" if clear_cut else "supporter"
+        triage = {"latency_ms": round(1000 * latency, 1)}
+        if decision is not None:
+            triage.update(label=decision.label, confidence=decision.confidence, reason=decision.reason)
+            logger.info("分诊结果: %s (置信度 %.2f)", decision.label, decision.confidence)
+
         logger.info("规划完成，下一步: %s", next_step)
-        
+
         return {
             "next": next_step,
+            "triage": triage,
             "status": "planned"
-        }
\ No newline at end of file
+        }
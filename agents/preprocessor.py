@@ -1,8 +1,14 @@
 # agents/preprocessor.py
+import asyncio
+import base64
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from schemas.state import AgentState
+from schemas.media import MediaRef, has_media, media_mime, media_to_base64
 from tools.tool_pool import tool_pool
 from utils.logger import get_logger, log_execution
+from utils.image import normalize_image_in_pool, anormalize_image_in_pool
 from config import settings
 
 logger = get_logger(__name__)
@@ -15,38 +21,119 @@ class PreprocessorAgent:
     @log_execution()
     def process(self, state: AgentState) -> dict:
         """预处理节点 - 识别模态并转换内容"""
+        image = self._image_data(state)
+        image_info = None
+        if image:
+            image_info = self._checked_image(image, normalize_image_in_pool)
+        modalities, translated_text, requests = self._prepare(state, image_info)
+
+        # 各模态互不依赖，并发调用多模态模型，总耗时取决于最慢的一个
+        descriptions = {}
+        if requests:
+            start = time.monotonic()
+            executor = ThreadPoolExecutor(max_workers=len(requests), thread_name_prefix="preprocess")
+            try:
+                futures = {
+                    modality: executor.submit(self.llm.invoke, messages)
+                    for modality, messages in requests
+                }
+                for modality, future in futures.items():
+                    remaining = start + self._timeout(modality) - time.monotonic()
+                    try:
+                        descriptions[modality] = future.result(timeout=max(0.0, remaining)).content
+                    except FuturesTimeoutError:
+                        descriptions[modality] = self._timed_out(modality)
+            finally:
+                # 超时的调用不再等待
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        return self._finish(modalities, translated_text, descriptions, image_info)
+
+    @log_execution()
+    async def aprocess(self, state: AgentState) -> dict:
+        """预处理节点（异步版本）"""
+        image = self._image_data(state)
+        image_info = None
+        if image:
+            try:
+                image_info = await anormalize_image_in_pool(image)
+            except ValueError as e:
+                image_info = self._fallback_image(image, e)
+        modalities, translated_text, requests = self._prepare(state, image_info)
+
+        async def describe(modality, messages):
+            try:
+                response = await asyncio.wait_for(
+                    self.llm.ainvoke(messages), timeout=self._timeout(modality)
+                )
+                return response.content
+            except asyncio.TimeoutError:
+                return self._timed_out(modality)
+
+        results = await asyncio.gather(
+            *(describe(modality, messages) for modality, messages in requests)
+        )
+        descriptions = {
+            modality: result for (modality, _), result in zip(requests, results)
+        }
+
+        return self._finish(modalities, translated_text, descriptions, image_info)
+
+    def _timeout(self, modality: str) -> float:
+        return settings.PREPROCESS_TIMEOUTS.get(modality, 120)
+
+    def _timed_out(self, modality: str) -> str:
+        logger.warning("%s 模态处理超时 (%.0f 秒)", modality, self._timeout(modality))
+        return f"({modality} analysis timed out)"
+
+    def _image_data(self, state: AgentState):
+        """返回待规范化的图片数据（文件字节或旧式 base64 字符串）"""
+        image = state["raw_input"].get("image")
+        if not has_media(image):
+            return None
+        if isinstance(image, MediaRef):
+            return image.read_bytes()
+        return image
+
+    def _checked_image(self, image, normalize):
+        """规范化图片（缩放、重编码）；无法解码时退回原图"""
+        try:
+            return normalize(image)
+        except ValueError as e:
+            return self._fallback_image(image, e)
+
+    def _fallback_image(self, image, error) -> dict:
+        logger.warning("图片规范化失败，使用原图: %s", error)
+        if isinstance(image, bytes):
+            image = base64.b64encode(image).decode("utf-8")
+        return {"data": image, "mime": "image/jpeg", "detail": "high"}
+
+    def _prepare(self, state: AgentState, image_info: dict = None):
+        """识别输入模态，返回 (模态列表, 文本部分, 需要调用模型的 [(模态, messages)])"""
         input_data = state["raw_input"]
         logger.info("开始预处理输入数据")
-        
+
         modalities = []
         translated_text = ""
-        
+        requests = []
+
         # 记录输入模态
         logger.debug("检测输入模态: %s", list(input_data.keys()))
-        
+
         # 识别文本内容
         if input_data["text"] and input_data["text"].strip():
             modalities.append("text")
             text_content = input_data["text"]
-            
-            # 使用self.llm处理文本
-            prompt = "请分析这段文本内容，并识别可能存在的安全风险"
-            messages = [
-                {"role": "user", "content": prompt + "\n\n" + text_content}
-            ]
-            
+
             translated_text += f"- User Input Text: {text_content}\n"
-            
+
             logger.debug("已处理文本内容 (长度: %d)", len(text_content))
-        
+
         # 识别并处理图像
-        if input_data["image"] and input_data["image"].strip():
+        if image_info is not None:
             modalities.append("image")
-            logger.debug("开始处理图像数据 (长度: %d)", len(input_data["image"]))
-            
-            # 使用self.llm处理图像
-            from multimodal.vision import VisionProcessor
-            
+            logger.debug("开始处理图像数据 (长度: %d)", len(image_info["data"]))
+
             # 准备提示词和图像数据
             prompt = settings.PROMPT_TEMPLATES["preprocessor_image_prompt"].format(
                 instruction=state["instruction"],
@@ -55,70 +142,85 @@ class PreprocessorAgent:
             messages = [
                 {"role": "user", "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{input_data['image']}", "detail": "high"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{image_info['mime']};base64,{image_info['data']}", "detail": image_info["detail"]}}
                 ]}
             ]
-            
-            # 使用self.llm进行多模态处理
-            response = self.llm.invoke(messages)
-            img_desc = response.content
-            translated_text += f"Image description: {img_desc}\n"
-            
-            logger.info("图像处理完成: %s", img_desc[:50] + "...")
-        
+            requests.append(("image", messages))
+
         # 识别并处理音频
-        if input_data["audio"] and input_data["audio"].strip():
+        if has_media(input_data["audio"]):
             modalities.append("audio")
-            logger.debug("开始处理音频数据 (长度: %d)", len(input_data["audio"]))
-            
-            # 使用self.llm处理音频
+            audio = media_to_base64(input_data["audio"])
+            audio_mime = media_mime(input_data["audio"], "audio/mp3")
+            logger.debug("开始处理音频数据 (长度: %d)", len(audio))
+
             # 准备提示词和音频数据
             prompt = "请转录这段音频内容，并识别可能存在的安全风险"
             messages = [
                 {"role": "user", "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "audio", "audio": {"url": f"data:audio/mp3;base64,{input_data['audio']}"}}
+                    {"type": "audio", "audio": {"url": f"data:{audio_mime};base64,{audio}"}}
                 ]}
             ]
-            
-            # 使用self.llm进行多模态处理
-            response = self.llm.invoke(messages)
-            audio_desc = response.content
-            translated_text += f"- Audio transcription: {audio_desc}\n"
-            
-            logger.info("音频处理完成: %s", audio_desc[:50] + "...")
-        
+            requests.append(("audio", messages))
+
         # 识别并处理视频
-        if input_data["video"] and input_data["video"].strip():
+        if has_media(input_data["video"]):
             modalities.append("video")
-            logger.debug("开始处理视频数据 (长度: %d)", len(input_data["video"]))
-            
-            # 使用self.llm处理视频
+            video = media_to_base64(input_data["video"])
+            video_mime = media_mime(input_data["video"], "video/mp4")
+            logger.debug("开始处理视频数据 (长度: %d)", len(video))
+
             # 准备提示词和视频数据
             prompt = "请分析这段视频内容，并识别可能存在的安全风险"
             messages = [
                 {"role": "user", "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "video", "video": {"url": f"data:video/mp4;base64,{input_data['video']}"}}
+                    {"type": "video", "video": {"url": f"data:{video_mime};base64,{video}"}}
                 ]}
             ]
-            
-            # 使用self.llm进行多模态处理
-            response = self.llm.invoke(messages)
-            video_desc = response.content
+            requests.append(("video", messages))
+
+        return modalities, translated_text, requests
+
+    def _finish(self, modalities, translated_text, descriptions, image_info=None) -> dict:
+        """按 图像 → 音频 → 视频 的固定顺序拼接模型输出"""
+        if "image" in descriptions:
+            img_desc = descriptions["image"]
+            translated_text += f"Image description: {img_desc}\n"
+            logger.info("图像处理完成: %s", img_desc[:50] + "...")
+
+        if "audio" in descriptions:
+            audio_desc = descriptions["audio"]
+            translated_text += f"- Audio transcription: {audio_desc}\n"
+            logger.info("音频处理完成: %s", audio_desc[:50] + "...")
+
+        if "video" in descriptions:
+            video_desc = descriptions["video"]
             translated_text += f"- Video analysis: {video_desc}\n"
-            
             logger.info("视频处理完成: %s", video_desc[:50] + "...")
-        
+
         # 如果没有识别到任何模态
         if not modalities:
             translated_text = "未识别到有效输入内容"
             logger.warning("未识别到任何有效输入模态")
-        
+
         logger.info("预处理完成，识别模态: %s", modalities)
-        
+
+        # 记录图片规范化前后的尺寸与 token 估算
+        image_stats = {}
+        if image_info is not None:
+            image_stats = {k: v for k, v in image_info.items() if k != "data"}
+            if "saved_tokens" in image_stats:
+                logger.info(
+                    "图片已规范化: %s → %s，视觉 token 约 %d → %d",
+                    image_stats["original_size"], image_stats["size"],
+                    image_stats["original_tokens"], image_stats["tokens"],
+                )
+
         return {
             "modalities": modalities,
             "translated_text": translated_text,
+            "image_stats": image_stats,
             "status": "preprocessed"
-        }
\ No newline at end of file
+        }
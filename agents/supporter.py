@@ -1,27 +1,135 @@
 from schemas.state import AgentState
+from schemas.media import MediaRef
 from tools.tool_pool import tool_pool
 from utils.logger import get_logger, log_execution
 from config import settings
-from typing import List
-import time
-import json
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from pathlib import Path
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from baidusearch.baidusearch import search as baidu_search
-from tools.baidu_image_search import search_image_urls
+from tools.baidu_image_search import search_image_urls, search_image_urls_async
 from tools.rag_tool import rag_tool
 
 logger = get_logger(__name__)
 
+_NO_CASES = "(No relevant historical cases found.)"
+_NO_BACKGROUND = "No background information."
+
+
+class BackgroundDecision(BaseModel):
+    """Decide whether background retrieval is needed for a content safety assessment."""
+
+    need_background: bool = Field(
+        description="Whether the input contains entities or terms crucial for the safety judgment that need background retrieval"
+    )
+    keywords: List[str] = Field(
+        description="1-5 search keywords or entities from the input, most important first. Always provide them, even if need_background is false."
+    )
+    search_focus: Optional[str] = Field(
+        default=None,
+        description="Key information to focus on during retrieval (e.g., background of the person, historical controversies, sensitive events)",
+    )
+    explanation: Optional[str] = Field(
+        default=None, description="Brief explanation when no background retrieval is needed"
+    )
+
 
 class SupporterAgent:
     def __init__(self):
         self.llm = settings.get_llm("supporter")
+        # 决策与关键词由一次结构化输出调用给出，无需再解析自由文本 JSON
+        self.decider = self.llm.with_structured_output(BackgroundDecision)
         logger.info("支持者智能体已初始化，使用模型: %s", self.llm.model_name)
+        # 历史案例库在后台加载，不阻塞工作流构建
+        rag_tool.start_warmup()
 
     @log_execution()
     def collect_background(self, state: AgentState) -> dict:
         """支持者节点 - 收集背景信息"""
         logger.info("开始收集背景信息")
 
+        decision = self._decide(state)
+        need_background, keywords, search_focus = self._unpack_decision(decision)
+
+        # 预先定义用于返回的检索结果块，兼容原有字段名
+        web_block = ""
+        image_block = ""
+        need_background = True
+        if not need_background:
+            background = self._explanation_background(decision)
+        else:
+            if not keywords:
+                keywords = self._extract_search_terms(
+                    state["translated_text"], max_terms=5
+                )
+            logger.info("需要检索，关键词：%s", keywords)
+
+            web_block, image_block, historical_cases = self._gather_evidence(
+                state, keywords
+            )
+
+            if self._has_evidence(web_block, image_block, historical_cases):
+                summarize_prompt = self._build_summarize_prompt(
+                    state, web_block, image_block, historical_cases
+                )
+                summary_resp = self.llm.invoke(summarize_prompt)
+                background = summary_resp.content
+            else:
+                logger.info("各来源均无检索结果，跳过背景总结")
+                background = _NO_BACKGROUND
+
+        return {
+            "background": background,
+            "status": "background_collected",
+            "wiki_summaries": web_block,
+            # "image_summaries": image_block,
+        }
+
+    @log_execution()
+    async def acollect_background(self, state: AgentState) -> dict:
+        """支持者节点（异步版本）- 收集背景信息"""
+        logger.info("开始收集背景信息")
+
+        decision = await self._adecide(state)
+        need_background, keywords, search_focus = self._unpack_decision(decision)
+
+        web_block = ""
+        image_block = ""
+        need_background = True
+        if not need_background:
+            background = self._explanation_background(decision)
+        else:
+            if not keywords:
+                keywords = await self._aextract_search_terms(
+                    state["translated_text"], max_terms=5
+                )
+            logger.info("需要检索，关键词：%s", keywords)
+
+            web_block, image_block, historical_cases = await self._agather_evidence(
+                state, keywords
+            )
+
+            if self._has_evidence(web_block, image_block, historical_cases):
+                summarize_prompt = self._build_summarize_prompt(
+                    state, web_block, image_block, historical_cases
+                )
+                summary_resp = await self.llm.ainvoke(summarize_prompt)
+                background = summary_resp.content
+            else:
+                logger.info("各来源均无检索结果，跳过背景总结")
+                background = _NO_BACKGROUND
+
+        return {
+            "background": background,
+            "status": "background_collected",
+            "wiki_summaries": web_block,
+        }
+
+    def _build_decision_prompt(self, state: AgentState) -> str:
+        """构建“是否需要检索背景”的决策提示"""
         # 首先从 settings 中读取新的模板，如果没有则使用内置默认模板。
         decision_template = settings.PROMPT_TEMPLATES.get(
             "collect_background")
@@ -38,204 +146,293 @@ class SupporterAgent:
                 else decision_prompt
             ),
         )
+        return decision_prompt
 
-        decision_resp = self.llm.invoke(decision_prompt)
-        decision_raw = decision_resp.content.strip()
+    def _decide(self, state: AgentState) -> Optional[BackgroundDecision]:
+        """结构化输出：一次调用得到是否检索、关键词与检索重点；失败时返回 None"""
+        try:
+            return self.decider.invoke(self._build_decision_prompt(state))
+        except Exception as e:
+            logger.warning("背景检索决策失败，回退到关键词抽取: %s", e)
+            return None
 
-        # 解析模型的 JSON 输出（容错处理）
-        need_background = True
+    async def _adecide(self, state: AgentState) -> Optional[BackgroundDecision]:
+        """_decide 的异步版本"""
+        try:
+            return await self.decider.ainvoke(self._build_decision_prompt(state))
+        except Exception as e:
+            logger.warning("背景检索决策失败，回退到关键词抽取: %s", e)
+            return None
+
+    def _unpack_decision(self, decision: Optional[BackgroundDecision]):
+        """返回 (need_background, keywords, search_focus)；决策失败时关键词留空，由调用方回退到关键词抽取"""
+        if decision is None:
+            return True, [], None
         keywords = []
-        search_focus = None
+        for k in decision.keywords:
+            k = k.strip()
+            if k and k not in keywords:
+                keywords.append(k)
+        return decision.need_background, keywords[:5], decision.search_focus
+
+    def _explanation_background(self, decision: Optional[BackgroundDecision]) -> str:
+        """模型判断无需额外检索，使用模型返回的解释作为 background（如果有）"""
+        explanation = decision.explanation if decision is not None else None
+        return explanation or "(No background retrieval required)"
+
+    def _has_evidence(self, web_block: str, image_block: str, historical_cases: str) -> bool:
+        """任一来源有检索结果时才需要总结"""
+        return (
+            web_block != self._format_web_block([])
+            or image_block != self._format_image_block([])
+            or historical_cases != _NO_CASES
+        )
+
+    def _gather_evidence(self, state: AgentState, keywords: List[str]):
+        """并发执行各检索来源，共享同一截止时间；超时的来源按无结果处理。
+
+        返回 (web_block, image_block, historical_cases)
+        """
+        terms = [t for t in keywords[:2] if t]
+        executor = ThreadPoolExecutor(max_workers=len(terms) + 2, thread_name_prefix="supporter")
         try:
-            decision = json.loads(decision_raw)
-            need_background = bool(decision.get("need_background", True))
-            keywords = decision.get("keywords") or []
-            search_focus = (
-                decision.get("search_focus") or decision.get("explanation") or None
+            web_futures = [executor.submit(self._search_keyword, t) for t in terms]
+            image_future = executor.submit(self._search_images, state)
+            cases_future = executor.submit(self._search_cases, state)
+
+            done, not_done = wait(
+                web_futures + [image_future, cases_future],
+                timeout=settings.SUPPORTER_DEADLINE,
             )
-        except Exception:
-            # 若解析失败，尝试降级解析并回退到关键词抽取
-            logger.debug("解析决策结果为 JSON 失败，原始输出: %s", decision_raw)
-            # 如果输出明显表明无需检索，则尊重模型判断
-            if "need_background" in decision_raw and "false" in decision_raw.lower():
-                need_background = False
-            else:
-                # 否则默认认为需要背景，并从文本中抽取关键词（降级方案）
-                keywords = self._extract_search_terms(
-                    state["translated_text"], max_terms=5
-                )
+            if not_done:
+                logger.warning("背景检索超时 (%.0f 秒)，%d 个来源未完成，使用已有结果",
+                               settings.SUPPORTER_DEADLINE, len(not_done))
 
-        # 预先定义用于返回的检索结果块，兼容原有字段名
-        web_block = ""
-        image_block = ""
-        need_background = True
-        if not need_background:
-            # 模型判断无需额外检索，使用模型返回的解释作为 background（如果有）
-            try:
-                decision = json.loads(decision_raw)
-                explanation = decision.get("explanation")
-            except Exception:
-                explanation = decision_raw
-            background = explanation or "(No background retrieval required)"
-        else:
-            if not keywords:
-                keywords = self._extract_search_terms(
-                    state["translated_text"], max_terms=5
+            web_results = [f.result() if f in done else [] for f in web_futures]
+            image_block = (
+                image_future.result() if image_future in done
+                else self._format_image_block([])
+            )
+            historical_cases = (
+                cases_future.result() if cases_future in done
+                else _NO_CASES
+            )
+        finally:
+            # 不等待超时的检索
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return self._format_web_block(web_results), image_block, historical_cases
+
+    async def _agather_evidence(self, state: AgentState, keywords: List[str]):
+        """_gather_evidence 的异步版本"""
+        terms = [t for t in keywords[:2] if t]
+        # 百度检索与案例库检索为同步 IO，放入线程执行以免阻塞事件循环
+        web_tasks = [
+            asyncio.ensure_future(asyncio.to_thread(self._search_keyword, t))
+            for t in terms
+        ]
+        image_task = asyncio.ensure_future(self._asearch_images(state))
+        cases_task = asyncio.ensure_future(asyncio.to_thread(self._search_cases, state))
+
+        done, not_done = await asyncio.wait(
+            web_tasks + [image_task, cases_task],
+            timeout=settings.SUPPORTER_DEADLINE,
+        )
+        if not_done:
+            logger.warning("背景检索超时 (%.0f 秒)，%d 个来源未完成，使用已有结果",
+                           settings.SUPPORTER_DEADLINE, len(not_done))
+            for task in not_done:
+                task.cancel()
+
+        web_results = [t.result() if t in done else [] for t in web_tasks]
+        image_block = (
+            image_task.result() if image_task in done
+            else self._format_image_block([])
+        )
+        historical_cases = (
+            cases_task.result() if cases_task in done
+            else _NO_CASES
+        )
+        return self._format_web_block(web_results), image_block, historical_cases
+
+    def _search_keyword(self, term: str) -> List[str]:
+        """对单个关键词执行百度检索，返回格式化后的结果行"""
+        lines = []
+        try:
+            results = self._search_baidu(term, max_results=1)
+            for r in results:
+                title = r.get("title", "")
+                abstract = r.get("abstract", "")
+                lines.append(
+                    f"word: {term} | title: {title} | abstract: {abstract} \n"
                 )
-            logger.info("需要检索，关键词：%s", keywords)
+        except Exception as e:
+            logger.debug("百度搜索失败（%s）：%s", term, e)
+        return lines
+
+    def _format_web_block(self, web_results: List[List[str]]) -> str:
+        """按关键词顺序拼接百度检索结果"""
+        web_summaries = [line for lines in web_results for line in lines]
+        return (
+            "".join(web_summaries) if web_summaries else "(No Baidu search results found.)"
+        )
 
-            web_summaries = []
-            image_summaries = []
-            for t in keywords[:2]:
-                if not t:
-                    continue
+    def _image_path(self, state: AgentState):
+        """当输入包含图像模态并提供本地图片路径时，返回该路径"""
+        if "image" not in state.get("modalities", []):
+            return None
+        raw = state.get("raw_input", {}) or {}
+        image = raw.get("image")
+        if isinstance(image, MediaRef):
+            return image.path
+        # 兼容多种可能字段名
+        candidate_paths = [
+            raw.get("image_path"),
+            raw.get("image_file"),
+        ]
+        return next(
+            (
+                p
+                for p in candidate_paths
+                if isinstance(p, str) and p.strip()
+            ),
+            None,
+        )
+
+    def _format_image_block(self, urls: List[str]) -> str:
+        if not urls:
+            return "(No image results retrieved)"
+        return "".join(f"图片: {u}\n" for u in urls)
+
+    def _search_images(self, state: AgentState) -> str:
+        """图片检索：执行“以图搜图”"""
+        urls = []
+        try:
+            image_path = self._image_path(state)
+            if image_path:
                 try:
-                    results = self._search_baidu(t, max_results=1)
-                    if results:
-                        for r in results:
-                            title = r.get("title", "")
-                            abstract = r.get("abstract", "")
-                            url = r.get("url", "")
-                            web_summaries.append(
-                                f"word: {t} | title: {title} | abstract: {abstract} \n"
-                            )
+                    urls = search_image_urls(Path(image_path), max_results=5)
                 except Exception as e:
-                    logger.debug("百度搜索失败（%s）：%s", t, e)
-                time.sleep(0.2)
+                    logger.debug("以图搜图失败（%s）：%s", image_path, e)
+                    urls = []
+        except Exception as e:
+            logger.debug("图片检索流程出错: %s", e)
+        return self._format_image_block(urls)
 
-            web_block = (
-                "".join(web_summaries) if web_summaries else "(No Baidu search results found.)"
-            )
+    async def _asearch_images(self, state: AgentState) -> str:
+        """图片检索（异步版本）"""
+        urls = []
+        try:
+            image_path = self._image_path(state)
+            if image_path:
+                try:
+                    urls = await search_image_urls_async(Path(image_path), max_results=5)
+                except Exception as e:
+                    logger.debug("以图搜图失败（%s）：%s", image_path, e)
+                    urls = []
+        except Exception as e:
+            logger.debug("图片检索流程出错: %s", e)
+        return self._format_image_block(urls)
 
-            # 图片检索：当输入包含图像模态并提供本地图片路径时执行“以图搜图”
-            image_block = "(No image results retrieved)"
-            try:
-                if "image" in state.get("modalities", []):
-                    raw = state.get("raw_input", {}) or {}
-                    # 兼容多种可能字段名
-                    candidate_paths = [
-                        raw.get("image_path"),
-                        raw.get("image_file"),
-                        raw.get("image"),
-                    ]
-                    image_path = next(
-                        (
-                            p
-                            for p in candidate_paths
-                            if isinstance(p, str) and p.strip()
-                        ),
-                        None,
-                    )
-                    if image_path:
-                        from pathlib import Path as _Path
-
-                        try:
-                            urls = search_image_urls(_Path(image_path), max_results=5)
-                        except Exception as e:
-                            logger.debug("以图搜图失败（%s）：%s", image_path, e)
-                            urls = []
-                        if urls:
-                            for u in urls:
-                                image_summaries.append(f"图片: {u}\n")
-                            image_block = "".join(image_summaries)
-            except Exception as e:
-                logger.debug("图片检索流程出错: %s", e)
-
-            # RAG 历史案例搜索
-            historical_cases = ""
-            try:
-                # 显示案例库状态
-                import os
-
-                reports_dir = "reports"
-                if os.path.exists(reports_dir):
-                    report_files = [
-                        f for f in os.listdir(reports_dir) if f.endswith(".txt")
-                    ]
-                    # print(f"📁 案例库状态: 存在 {len(report_files)} 个历史报告文件")
-                else:
-                    print("📁不存在")
-
-                logger.info("开始搜索历史案例库...")
-                print("🔍 开始搜索历史案例库...")
-                historical_cases = rag_tool.search_historical_cases(
-                    state["translated_text"], max_results=3
-                )
-                if (
-                    historical_cases
-                    and historical_cases != "RAG 系统未初始化，无法搜索历史案例"
-                    and "No relevant historical cases found." not in historical_cases
-                ):
-                    logger.info("✅ 从案例库中搜索到相关历史案例")
-                    print("✅ 从案例库中搜索到相关历史案例")
-                    # 显示案例摘要
-                    lines = historical_cases.split("\n")
-                    print("相关历史案例摘要:")
-                    for line in lines[:3]:  # 只显示前3行
-                        if line.strip():
-                            print(f"  {line.strip()}")
-                else:
-                    logger.info("❌ 未从案例库中搜索到相关历史案例")
-                    print("❌ 未从案例库中搜索到相关历史案例")
-                    historical_cases = "(No relevant historical cases found.)"
-            except Exception as e:
-                logger.debug("RAG 历史案例搜索失败: %s", e)
-                print(f"⚠️ 历史案例搜索出错: {e}")
-                historical_cases = "(No relevant historical cases found.)"
-
-            # 让模型基于原文、摘要与额外信息做最终的总结整理（可被 settings 覆盖）
-            summarize_template = settings.PROMPT_TEMPLATES.get(
-                "summarize_background",
-            )
+    def _search_cases(self, state: AgentState) -> str:
+        """RAG 历史案例搜索"""
+        historical_cases = ""
+        try:
+            # 显示案例库状态
+            reports_dir = "reports"
+            if os.path.exists(reports_dir):
+                report_files = [
+                    f for f in os.listdir(reports_dir) if f.endswith(".txt")
+                ]
+                # print(f"📁 案例库状态: 存在 {len(report_files)} 个历史报告文件")
+            else:
+                print("📁不存在")
 
-            summarize_prompt = summarize_template.format(
-                translated_text=state["translated_text"],
-                wiki_summaries=web_block,
-                image_summaries=image_block,
-                historical_cases=historical_cases,
-            )
-            logger.debug(
-                "汇总提示: %s",
-                (
-                    (summarize_prompt[:200] + "...")
-                    if len(summarize_prompt) > 200
-                    else summarize_prompt
-                ),
+            logger.info("开始搜索历史案例库...")
+            print("🔍 开始搜索历史案例库...")
+            historical_cases = rag_tool.search_historical_cases(
+                state["translated_text"], max_results=3
             )
+            if (
+                historical_cases
+                and not historical_cases.startswith(
+                    ("RAG 系统未初始化", "未找到相关的历史案例", "搜索历史案例时出错")
+                )
+                and _NO_CASES not in historical_cases
+            ):
+                logger.info("✅ 从案例库中搜索到相关历史案例")
+                print("✅ 从案例库中搜索到相关历史案例")
+                # 显示案例摘要
+                lines = historical_cases.split("\n")
+                print("相关历史案例摘要:")
+                for line in lines[:3]:  # 只显示前3行
+                    if line.strip():
+                        print(f"  {line.strip()}")
+            else:
+                logger.info("❌ 未从案例库中搜索到相关历史案例")
+                print("❌ 未从案例库中搜索到相关历史案例")
+                historical_cases = _NO_CASES
+        except Exception as e:
+            logger.debug("RAG 历史案例搜索失败: %s", e)
+            print(f"⚠️ 历史案例搜索出错: {e}")
+            historical_cases = _NO_CASES
+        return historical_cases
 
-            summary_resp = self.llm.invoke(summarize_prompt)
-            background = summary_resp.content
+    def _build_summarize_prompt(self, state: AgentState, web_block: str, image_block: str, historical_cases: str) -> str:
+        """让模型基于原文、摘要与额外信息做最终的总结整理（可被 settings 覆盖）"""
+        summarize_template = settings.PROMPT_TEMPLATES.get(
+            "summarize_background",
+        )
 
-        return {
-            "background": background,
-            "status": "background_collected",
-            "wiki_summaries": web_block,
-            # "image_summaries": image_block,
-        }
+        summarize_prompt = summarize_template.format(
+            translated_text=state["translated_text"],
+            wiki_summaries=web_block,
+            image_summaries=image_block,
+            historical_cases=historical_cases,
+        )
+        logger.debug(
+            "汇总提示: %s",
+            (
+                (summarize_prompt[:200] + "...")
+                if len(summarize_prompt) > 200
+                else summarize_prompt
+            ),
+        )
+        return summarize_prompt
 
     def _search_baidu(self, term: str, max_results: int = 3) -> List[dict]:
-        """使用 baidusearch 进行关键词检索，返回若干条结果。"""
+        """使用 baidusearch 进行关键词检索，返回若干条结果。
+
+        结果按归一化后的关键词缓存在磁盘上（带 TTL），并发样本检索同一关键词时只请求一次。
+        """
+        key = "baidu:" + " ".join(term.lower().split())
         try:
-            results = baidu_search(term)
-            if not isinstance(results, list):
-                return []
-            # 仅保留 title/abstract/url 字段，并裁剪数量
-            cleaned = []
-            for item in results[: max_results if max_results > 0 else None]:
-                if not isinstance(item, dict):
-                    continue
-                cleaned.append(
-                    {
-                        "title": item.get("title", ""),
-                        "abstract": item.get("abstract", ""),
-                        "url": item.get("url", ""),
-                    }
-                )
-            return cleaned
+            results = settings.get_search_cache().get_or_compute(
+                key, lambda: self._fetch_baidu(term)
+            )
+            return results[: max_results if max_results > 0 else None]
         except Exception as e:
             logger.debug("调用 baidusearch 出错: %s", e)
             return []
 
+    def _fetch_baidu(self, term: str) -> List[dict]:
+        """实际调用 baidusearch，仅保留 title/abstract/url 字段"""
+        results = baidu_search(term)
+        if not isinstance(results, list):
+            return []
+        cleaned = []
+        for item in results:
+            if not isinstance(item, dict):
+                continue
+            cleaned.append(
+                {
+                    "title": item.get("title", ""),
+                    "abstract": item.get("abstract", ""),
+                    "url": item.get("url", ""),
+                }
+            )
+        return cleaned
+
     def _extract_search_terms(self, text: str, max_terms: int = 5) -> List[str]:
         """使用 LLM 从文本中抽取若干供搜索的关键词/实体。
 
@@ -245,30 +442,46 @@ class SupporterAgent:
         if not text or not text.strip():
             return []
 
-        # 让模型返回一个用逗号分隔的关键词列表
-        extract_prompt = (
-            "请从下面的文本中抽取最多 {n} 个用于检索的关键词或实体，返回时用逗号分隔。"
-            "不要添加额外说明，只返回关键词列表。\n\n文本:\n{txt}"
-        ).format(n=max_terms, txt=text)
+        try:
+            resp = self.llm.invoke(self._build_extract_prompt(text, max_terms))
+            return self._parse_search_terms(resp.content, max_terms)
+        except Exception as e:
+            logger.debug("LLM 抽取关键词失败: %s", e)
+            return []
+
+    async def _aextract_search_terms(self, text: str, max_terms: int = 5) -> List[str]:
+        """_extract_search_terms 的异步版本"""
+        if not text or not text.strip():
+            return []
 
         try:
-            resp = self.llm.invoke(extract_prompt)
-            raw = resp.content.strip()
-            # 规范化：用逗号或换行拆分，并去重
-            parts = [p.strip() for p in raw.replace("\n", ",").split(",") if p.strip()]
-            seen = set()
-            terms = []
-            for p in parts:
-                if p not in seen:
-                    seen.add(p)
-                    terms.append(p)
-                if len(terms) >= max_terms:
-                    break
-            return terms
+            resp = await self.llm.ainvoke(self._build_extract_prompt(text, max_terms))
+            return self._parse_search_terms(resp.content, max_terms)
         except Exception as e:
             logger.debug("LLM 抽取关键词失败: %s", e)
             return []
 
+    def _build_extract_prompt(self, text: str, max_terms: int) -> str:
+        # 让模型返回一个用逗号分隔的关键词列表
+        return (
+            "请从下面的文本中抽取最多 {n} 个用于检索的关键词或实体，返回时用逗号分隔。"
+            "不要添加额外说明，只返回关键词列表。\n\n文本:\n{txt}"
+        ).format(n=max_terms, txt=text)
+
+    def _parse_search_terms(self, raw: str, max_terms: int) -> List[str]:
+        raw = raw.strip()
+        # 规范化：用逗号或换行拆分，并去重
+        parts = [p.strip() for p in raw.replace("\n", ",").split(",") if p.strip()]
+        seen = set()
+        terms = []
+        for p in parts:
+            if p not in seen:
+                seen.add(p)
+                terms.append(p)
+            if len(terms) >= max_terms:
+                break
+        return terms
+
     def _gather_additional_info(self, state: AgentState) -> str:
         """使用工具收集额外背景信息。"""
         additional_info = []
@@ -1,8 +1,9 @@
 # config.py
 import os
 import logging
+import threading
 from logging.config import dictConfig
-from prompts import preprocessor_prompt,supporter_prompt,debaters_prompt,arbitrator_prompt
+from prompts import preprocessor_prompt,planner_prompt,supporter_prompt,debaters_prompt,arbitrator_prompt
 from dotenv import load_dotenv
 
 load_dotenv()  
@@ -45,11 +46,15 @@ class Settings:
     # 提示模板
     PROMPT_TEMPLATES = {
         "image_to_text": preprocessor_prompt.Image_to_text_prompt,
+        "planner_triage": planner_prompt.triage_en,
         "collect_background": supporter_prompt.collect_background_en,
         "summarize_background": supporter_prompt.summarize_background_en,
         "debaters_role": debaters_prompt.debaters_role_en,
         "debate_next": debaters_prompt.debate_next_en,
+        "debate_risk_label": debaters_prompt.debate_risk_label_en,
         "arbitrator_prompt": arbitrator_prompt.arbitrator_en,
+        "arbitrator_task": arbitrator_prompt.arbitrator_task_en,
+        "case_context": debaters_prompt.case_context_en,
         "preprocessor_image_prompt": preprocessor_prompt.preprocessor_image_prompt_en,
 
 
@@ -64,13 +69,81 @@ class Settings:
 
     
 
+    # 规划者分诊：置信度达到阈值的明确样本跳过背景检索与辩论，直接仲裁
+    # （默认关闭：依赖模型自报的置信度，开启后会改变已有基准上的评估结果）
+    PLANNER_TRIAGE = os.getenv("PLANNER_TRIAGE", "0") == "1"
+    PLANNER_TRIAGE_THRESHOLD = float(os.getenv("PLANNER_TRIAGE_THRESHOLD", "0.9"))
+
     # 辩论设置
     DEBATE_ROUNDS = 2
+    # 收敛判定：双方风险标签一致或新发言大部分重复已有发言时提前结束辩论
+    DEBATE_CONVERGENCE = os.getenv("DEBATE_CONVERGENCE", "1") == "1"
+    DEBATE_MIN_ROUNDS = int(os.getenv("DEBATE_MIN_ROUNDS", "1"))  # 标签一致判定最早生效的轮次
+    DEBATE_REPEAT_THRESHOLD = float(os.getenv("DEBATE_REPEAT_THRESHOLD", "0.6"))  # 与已有发言的二元词组 Jaccard 相似度
+    # 第一轮所有角色并发生成开场陈述（彼此不可见），第二轮起再交替发言；会改变辩论记录的形态
+    DEBATE_PARALLEL_OPENING = os.getenv("DEBATE_PARALLEL_OPENING", "0") == "1"
+    # 辩论者提示中历史发言的 token 预算（对方最近一次发言总会保留）
+    DEBATE_HISTORY_TOKENS = int(os.getenv("DEBATE_HISTORY_TOKENS", "4000"))
+
+    # 背景检索设置
+    SUPPORTER_DEADLINE = 20  # 各检索来源共享的截止时间（秒）
+
+    # 检索结果缓存（百度搜索 / 以图搜图，按归一化关键词或图片内容哈希）
+    SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search_cache.db")
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(7 * 24 * 3600)))  # 秒
+    SEARCH_CACHE_MAX_ENTRIES = 50000
+    IMAGE_SEARCH_CONCURRENCY = 4  # 同时进行的以图搜图请求数
+
+    # 历史案例检索（RAG）设置
+    RAG_REPORTS_DIR = "reports"
+    RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", ".cache/rag_index")  # 持久化向量索引目录
+    RAG_VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float16")  # 向量存储精度：float16 / float32
+    RAG_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "auto")  # exact / ivf / auto（行数超过 RAG_IVF_MIN_ROWS 时用 IVF）
+    # 实测（python -m tools.vector_search，1536 维 float16，单核）：精确检索约 4.5 µs/行，
+    # 1 万 / 10 万 / 100 万行分别约 40 / 420 / 4700 ms；IVF 在分散数据上 recall@5 仅 0.72–0.87。
+    # 5 万行以内精确检索约 0.2 秒且召回无损，超过后再换 IVF
+    RAG_IVF_MIN_ROWS = 50000
+    # nprobe 16 → 64：10 万行 recall@5 0.72 → 0.83、耗时 6 → 20 ms；100 万行 0.80 → 0.85、26 → 110 ms
+    RAG_IVF_NPROBE = 64  # IVF 检索时探测的簇数，越大召回越高、越慢
+    RAG_BM25_CANDIDATES = 50  # BM25 预筛选的候选数，仅对候选做向量重排
+    RAG_BM25_DECISIVE_RATIO = 1.5  # 第 k 名与第 k+1 名的 BM25 分数比超过该值时跳过向量重排
+    RAG_WARMUP_WAIT = float(os.getenv("RAG_WARMUP_WAIT", "0"))  # 查询时等待后台初始化的最长秒数，0 表示不等待
+    # 批量评估生成的报告实时加入案例库（默认关闭：写入的报告含最终结论，评测时会泄漏到后续检索中）
+    RAG_INGEST_RESULTS = os.getenv("RAG_INGEST_RESULTS", "0") == "1"
+    EMBEDDING_BATCH_SIZE = 512  # 单次嵌入请求的最大文本数
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.db")  # 按内容哈希缓存的向量
+    EMBEDDING_QUERY_CACHE_SIZE = 1024  # 进程内缓存的查询向量条数
+
+    # 批量评估设置
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # 同时在工作流中运行的样本数
+    RESULT_DB = os.getenv("RESULT_DB", "result/results.db")  # 评估结果库（SQLite）
     
     # 多模态处理设置
-    MAX_IMAGE_SIZE = (256, 256)
+    MAX_IMAGE_SIZE = (256, 256)  # 图片以 detail=low 发送，不应超过 512px
+    IMAGE_JPEG_QUALITY = 85
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))  # 图片规范化线程数
     MAX_AUDIO_DURATION = 60  # 秒
+    PREPROCESS_TIMEOUTS = {"image": 60, "audio": 120, "video": 180}  # 各模态模型调用超时（秒）
     
+    # HTTP 连接池设置（应不小于 BATCH_CONCURRENCY）
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "32"))
+    HTTP_KEEPALIVE_EXPIRY = 60  # 秒
+    HTTP_TIMEOUT = 120  # 秒
+
+    # 部署限流（按各 Azure 部署的实际配额修改；RATE_LIMIT=0 关闭）
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1") == "1"
+    RATE_LIMITS = {
+        "gpt-4o": {"rpm": 480, "tpm": 80000},
+        "gpt-4o-mini": {"rpm": 1500, "tpm": 250000},
+        "gpt-35-turbo": {"rpm": 720, "tpm": 120000},
+    }
+
+    # LLM 响应缓存（默认关闭，设置 LLM_CACHE=1 开启）
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "0") == "1"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.db")
+    LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+
     # 日志设置
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)-20s | %(message)s"
@@ -79,28 +152,194 @@ class Settings:
     @classmethod
     def get_llm(cls, agent_name: str = None):
         """获取特定智能体的语言模型"""
-        from langchain_openai import ChatOpenAI, AzureChatOpenAI,AzureOpenAI
-
-        
         model = cls.AGENT_MODELS.get(agent_name, cls.DEFAULT_MODEL)
+        return cls.create_chat_model(model)
+
+    # 客户端注册表：同一 (endpoint, model) 的所有调用方共享同一个模型实例与 HTTP 连接池
+    _registry_lock = threading.RLock()
+    _http_clients = {}
+    _chat_models = {}
+    _embeddings = {}
+    _llm_cache = None
+    _search_cache = None
+    _rate_scheduler = None
+
+    @classmethod
+    def create_chat_model(cls, model: str, temperature: float = 0.1):
+        """按模型名获取共享的聊天模型实例（temperature 默认 0.1 以降低随机性）"""
+        from langchain_openai import ChatOpenAI, AzureChatOpenAI
+
+        endpoint = cls.AZURE_BASE_URL if model in cls.AZURE_MODELS else cls.OPENKEY_BASE_URL
+        key = (endpoint, model, temperature)
+        with cls._registry_lock:
+            llm = cls._chat_models.get(key)
+            if llm is not None:
+                return llm
+
+            http_client, http_async_client = cls.get_http_clients(endpoint, model)
+            limiter = cls.get_rate_scheduler().get(model)
+            limit_kwargs = {}
+            if limiter is not None:
+                from utils.rate_limiter import LangChainRateLimiter, TokenUsageHandler
+
+                limit_kwargs = {
+                    "rate_limiter": LangChainRateLimiter(limiter),
+                    "callbacks": [TokenUsageHandler(limiter)],
+                }
+            if model in cls.AZURE_MODELS:
+                llm = AzureChatOpenAI(
+                    api_version=cls.AZURE_API_VERSION,
+                    azure_endpoint=cls.AZURE_BASE_URL,
+                    api_key=cls.AZURE_API_KEY,
+                    model=model,
+                    temperature=temperature,
+                    cache=cls.get_llm_cache(),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    **limit_kwargs
+                )
+
+            else:
+                llm = ChatOpenAI(
+                    api_key=cls.OPENKEY_API_KEY,
+                    base_url=cls.OPENKEY_BASE_URL,
+                    model=model,
+                    temperature=temperature,
+                    cache=cls.get_llm_cache(),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    **limit_kwargs
+                )
+            cls._chat_models[key] = llm
+            return llm
+
+    @classmethod
+    def get_embeddings(cls, model: str = "text-embedding-ada-002"):
+        """获取共享的嵌入服务实例（按内容哈希去重、缓存并批量请求）"""
+        from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+        from tools.embedding_service import EmbeddingService
 
-        if model in cls.AZURE_MODELS:
-            return AzureChatOpenAI(
-                api_version=cls.AZURE_API_VERSION,
-                azure_endpoint=cls.AZURE_BASE_URL,
-                api_key=cls.AZURE_API_KEY,
-                model=model,
-                temperature=0.1  # 降低随机性
+        endpoint = cls.AZURE_BASE_URL if cls.USE_AZURE else cls.OPENKEY_BASE_URL
+        key = (endpoint, model)
+        with cls._registry_lock:
+            embeddings = cls._embeddings.get(key)
+            if embeddings is not None:
+                return embeddings
+
+            http_client, http_async_client = cls.get_http_clients(endpoint, model)
+            if cls.USE_AZURE:
+                embeddings = AzureOpenAIEmbeddings(
+                    api_key=cls.AZURE_API_KEY,
+                    azure_endpoint=cls.AZURE_BASE_URL,
+                    azure_deployment=model,
+                    api_version=cls.AZURE_API_VERSION,
+                    chunk_size=cls.EMBEDDING_BATCH_SIZE,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+            else:
+                embeddings = OpenAIEmbeddings(
+                    api_key=cls.OPENKEY_API_KEY,
+                    base_url=cls.OPENKEY_BASE_URL,
+                    model=model,
+                    chunk_size=cls.EMBEDDING_BATCH_SIZE,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+            embeddings = EmbeddingService(
+                embeddings,
+                model,
+                db_path=cls.EMBEDDING_CACHE_PATH,
+                batch_size=cls.EMBEDDING_BATCH_SIZE,
+                query_cache_size=cls.EMBEDDING_QUERY_CACHE_SIZE,
             )
+            cls._embeddings[key] = embeddings
+            return embeddings
 
-        else:
-            return ChatOpenAI(
-                api_key=cls.OPENKEY_API_KEY,
-                base_url=cls.OPENKEY_BASE_URL,
-                model=model,
-                temperature=0.1  # 降低随机性
+    @classmethod
+    def get_http_clients(cls, endpoint: str, model: str):
+        """获取 (endpoint, model) 对应的共享 keep-alive HTTP 客户端（同步, 异步）
+
+        安装了 h2 时启用 HTTP/2；连接池大小由 HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE 配置。
+        """
+        import httpx
+
+        key = (endpoint, model)
+        with cls._registry_lock:
+            clients = cls._http_clients.get(key)
+            if clients is not None:
+                return clients
+
+            try:
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+
+            limits = httpx.Limits(
+                max_connections=cls.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=cls.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=cls.HTTP_KEEPALIVE_EXPIRY,
             )
-    
+            timeout = httpx.Timeout(cls.HTTP_TIMEOUT, connect=10.0)
+            scheduler = cls.get_rate_scheduler()
+            clients = (
+                httpx.Client(
+                    http2=http2, limits=limits, timeout=timeout,
+                    event_hooks=scheduler.http_event_hooks(model),
+                ),
+                httpx.AsyncClient(
+                    http2=http2, limits=limits, timeout=timeout,
+                    event_hooks=scheduler.http_event_hooks(model, is_async=True),
+                ),
+            )
+            cls._http_clients[key] = clients
+            logging.getLogger(__name__).info(
+                "已创建 HTTP 连接池: %s (%s), http2=%s, max_connections=%d",
+                endpoint, model, http2, cls.HTTP_MAX_CONNECTIONS,
+            )
+            return clients
+
+    @classmethod
+    def get_rate_scheduler(cls):
+        """获取进程级的部署限流调度器（RATE_LIMIT=0 时不包含任何部署，即不限流）"""
+        with cls._registry_lock:
+            if cls._rate_scheduler is None:
+                from utils.rate_limiter import RateLimitScheduler
+
+                cls._rate_scheduler = RateLimitScheduler(
+                    cls.RATE_LIMITS if cls.RATE_LIMIT_ENABLED else {}
+                )
+            return cls._rate_scheduler
+
+    @classmethod
+    def get_llm_cache(cls):
+        """获取共享的 LLM 响应缓存；未开启时返回 None（即不使用缓存）"""
+        if not cls.LLM_CACHE_ENABLED:
+            return None
+        with cls._registry_lock:
+            if cls._llm_cache is None:
+                from utils.llm_cache import SQLiteLLMCache
+
+                cls._llm_cache = SQLiteLLMCache(
+                    cls.LLM_CACHE_PATH, max_bytes=cls.LLM_CACHE_MAX_MB * 1024 * 1024
+                )
+            return cls._llm_cache
+
+    @classmethod
+    def get_search_cache(cls):
+        """获取共享的检索结果缓存"""
+        with cls._registry_lock:
+            if cls._search_cache is None:
+                from utils.ttl_cache import TTLCache
+
+                cls._search_cache = TTLCache(
+                    cls.SEARCH_CACHE_PATH,
+                    ttl=cls.SEARCH_CACHE_TTL,
+                    max_entries=cls.SEARCH_CACHE_MAX_ENTRIES,
+                )
+            return cls._search_cache
+
     @classmethod
     def set_agent_model(cls, agent_name: str, model_name: str):
         """为特定智能体设置模型"""
@@ -1,4 +1,5 @@
 # graph/workflow.py
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from schemas.state import AgentState
 from agents.preprocessor import PreprocessorAgent
@@ -25,32 +26,32 @@ def create_workflow():
     # 定义工作流
     workflow = StateGraph(AgentState)
     
-    # 添加节点
-    workflow.add_node("preprocess", lambda state: preprocessor.process(state))
-    workflow.add_node("plan", lambda state: planner.plan(state))
-    workflow.add_node("supporter", lambda state: supporter.collect_background(state))
-    workflow.add_node("debate", lambda state: debater.debate(state))
-    workflow.add_node("arbitrator", lambda state: arbitrator.make_verdict(state))
+    # 添加节点（同时提供同步与异步实现，invoke 与 ainvoke 均可使用）
+    workflow.add_node("preprocess", RunnableLambda(preprocessor.process, afunc=preprocessor.aprocess))
+    workflow.add_node("plan", RunnableLambda(planner.plan, afunc=planner.aplan))
+    workflow.add_node("supporter", RunnableLambda(supporter.collect_background, afunc=supporter.acollect_background))
+    workflow.add_node("debate", RunnableLambda(debater.debate, afunc=debater.adebate))
+    workflow.add_node("arbitrator", RunnableLambda(arbitrator.make_verdict, afunc=arbitrator.amake_verdict))
     
     # 设置入口点
     workflow.set_entry_point("preprocess")
     
     # 添加边
     workflow.add_edge("preprocess", "plan")
-    workflow.add_edge("plan", "supporter")
     workflow.add_edge("supporter", "debate")
     workflow.add_edge("debate", "arbitrator")
     workflow.add_edge("arbitrator", END)
     
-    # 添加自定义状态转换日志
-    def log_transition(from_node, to_node, state):
-        log_state_transition(logger, from_node, to_node, state)
-        return to_node
+    # 规划者分诊后的路由：明确样本直接仲裁，其余走检索 + 辩论
+    def route_after_plan(state):
+        next_step = state.get("next", "supporter")
+        log_state_transition(logger, "plan", next_step, state)
+        return next_step
     
     workflow.add_conditional_edges(
         "plan",
-        lambda state: state.get("next", "supporter"),
-        log_transition
+        route_after_plan,
+        {"supporter": "supporter", "arbitrator": "arbitrator"}
     )
     
     # 编译工作流
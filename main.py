@@ -1,57 +1,32 @@
 # main.py
 from graph.workflow import safety_workflow
 from schemas.state import AgentState
-import base64
+from schemas.media import summarize_raw_input
+import argparse
+import asyncio
 import os
 from utils.logger import get_logger
 from tools.tool_pool import tool_pool  # 导入工具池
-import json
+from tools.rag_tool import rag_tool
+from agents.planner import route_stats
+from utils.batch import run_batch, arun_batch
+from utils.result_store import ResultStore
+from utils.prompt_cache import merge_usage, cache_hit_rate
+from utils.datasets import iter_json_array, DATASET_ADAPTERS, DatasetAdapter, JsonlAdapter, WildGuardAdapter, VHD11KAdapter, TextImgAdapter
+from config import settings
+import time
+from collections import Counter
 
 
 logger = get_logger(__name__)
 
-def get_sample_image(path: str = None):
-    """获取图片的Base64编码"""
-    if path is None:
-        return None
-    if os.path.exists(path):
-        with open(path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode("utf-8")
-    return None
-
-def get_sample_audio(path: str = None):
-    """获取音频的Base64编码"""
-    if path is None:
-        return None
-    if os.path.exists(path):
-        with open(path, "rb") as audio_file:
-            return base64.b64encode(audio_file.read()).decode("utf-8")
-    return None
-
-def get_sample_video(path: str = None):
-    """获取视频的Base64编码"""
-    if path is None:
-        return None
-    if os.path.exists(path):
-        with open(path, "rb") as video_file:
-            return base64.b64encode(video_file.read()).decode("utf-8")
-    return None
-
-def run_safety_assessment(instruction: str, input_data: dict):
-    """执行安全评估工作流"""
-    logger.info("开始安全评估流程")
-    
-    # 记录输入数据（隐藏长base64数据）
-    logged_data = {}
-    for k, v in input_data.items():
-        if isinstance(v, str) and len(v) > 100:
-            logged_data[k] = v[:50] + f"... [{len(v)} 字符]"
-        else:
-            logged_data[k] = v
-    logger.debug("输入数据: %s", logged_data)
+def _initial_state(instruction: str, input_data: dict) -> AgentState:
+    """构建工作流初始状态"""
+    # 记录输入数据（媒体只记录摘要）
+    logger.debug("输入数据: %s", summarize_raw_input(input_data))
     
     # 初始状态
-    initial_state = AgentState(
+    return AgentState(
         instruction=instruction,
         raw_input=input_data,
         modalities=[],
@@ -61,14 +36,39 @@ def run_safety_assessment(instruction: str, input_data: dict):
         verdict={},
         status="initialized"
     )
+
+def _record_route(result, latency: float):
+    """按规划者选择的路由记录端到端耗时"""
+    triage_ms = (result.get("triage") or {}).get("latency_ms", 0.0)
+    route_stats.record(result.get("next", "supporter"), latency, triage_ms / 1000)
+
+def run_safety_assessment(instruction: str, input_data: dict):
+    """执行安全评估工作流"""
+    logger.info("开始安全评估流程")
+    initial_state = _initial_state(instruction, input_data)
     
     # 执行工作流
     logger.info("执行工作流...")
+    start = time.perf_counter()
     result = safety_workflow.invoke(initial_state)
+    _record_route(result, time.perf_counter() - start)
     
     logger.info("安全评估完成，最终状态: %s", result["status"])
     return result
 
+async def arun_safety_assessment(instruction: str, input_data: dict):
+    """执行安全评估工作流（异步版本，可在同一事件循环中并发大量评估）"""
+    logger.info("开始安全评估流程")
+    initial_state = _initial_state(instruction, input_data)
+
+    logger.info("执行工作流...")
+    start = time.perf_counter()
+    result = await safety_workflow.ainvoke(initial_state)
+    _record_route(result, time.perf_counter() - start)
+
+    logger.info("安全评估完成，最终状态: %s", result["status"])
+    return result
+
 def save_report(result, filename="内容安全风险评估报告.txt"):
     """
     将背景知识、辩论过程和输出报告保存到一个结构清晰的文本文件中。
@@ -104,171 +104,170 @@ def save_report(result, filename="内容安全风险评估报告.txt"):
         f.write("【输出报告】\n")
         f.write(result["verdict"]["report"].strip() + "\n")
 
-def main_test_text(batch_size=50):
-    data_path = "data/WildGuard/WildGuard_1000.json"
-    out_data_path = "result/WildGuard/WildGuard_1000_output.json"
-    os.makedirs("result/WildGuard", exist_ok=True)
-
-    # 读取原始数据
-    with open(data_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    # data = data[:100]
-
-    # 检查已有的输出数据
-    processed_data = []
-    if os.path.exists(out_data_path):
-        with open(out_data_path, "r", encoding="utf-8") as f:
-            try:
-                processed_data = json.load(f)
-            except json.JSONDecodeError:
-                processed_data = []
-
-    # 已处理数量
-    start_idx = len(processed_data)
-    print(f"已处理 {start_idx}/{len(data)} 条数据，将从第 {start_idx} 条继续。")
-
-    out_data = processed_data[:]  # 拷贝已有结果
-
-    for idx, item in enumerate(data[start_idx:], start=start_idx):
-        text = f"\nPrompt: {item['prompt']}\nResponse: {item['response']}\n"
-        instruction ="Assess whether the large model’s response poses a safety risk.",   
-        input_data = {                     
-            "text": text,
-            "image": get_sample_image(),
-            "audio": get_sample_audio(),
-            "video": get_sample_video()
-        }
-        result = run_safety_assessment(instruction,input_data)
-
-        # 更新 item
-        item["risk_decision"] = result["verdict"]["risk_decision"]
-        item["raw_id"] = item['id']
-        item['id'] = idx
-
-        out_data.append(item)
-        save_report(result, f"result/WildGuard/report/WildGuard_{idx}.txt")
-
-        # 每 batch 保存一次
-        if (idx + 1) % batch_size == 0 or idx == len(data) - 1:
-            with open(out_data_path, "w", encoding="utf-8") as f:
-                json.dump(out_data, f, ensure_ascii=False, indent=4)
-            print(f"已保存到 {out_data_path} (进度: {idx+1}/{len(data)})")
-
-    print("全部处理完成 ✅")
-
-def main_only_img(batch_size=50):
-    data_path = "data\\VHD11K\\harmful_image_1200_ann.json"
-    img_dir = "data\\VHD11K\\harmful_images_1200"
-    out_data_path = "result\\VHD11K\\VHD11K_1200_output.json"
-    os.makedirs("result/VHD11K", exist_ok=True)
+def _seed_store(store: ResultStore, adapter: DatasetAdapter, path: str) -> int:
+    """结果库中还没有该数据集时，导入旧版本已导出的结果文件，避免重新评估并覆盖它"""
+    def rows():
+        for position, item in enumerate(iter_json_array(path)):
+            idx = adapter.stored_idx(position, item)
+            yield adapter.item_key(idx, item), idx, item
+    return store.append_many(adapter.name, rows())
+
+def run(adapter: DatasetAdapter, batch_size=50, concurrency=None, out_data_path=None,
+        use_async=False):
+    """对数据集执行并发评估，结果逐条写入结果库并支持按条目 id 断点续跑。
+
+    数据记录由适配器流式读取，媒体文件在条目真正开始评估时才加载，
+    因此大数据集可以立即开始处理。
+    use_async=True 时所有条目在同一个事件循环中通过 ainvoke 并发执行，不占用工作线程。
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    out_data_path = out_data_path or adapter.output_path
+    name = adapter.name
+    store = ResultStore(settings.RESULT_DB)
+    os.makedirs(adapter.report_dir, exist_ok=True)
+    # 案例库可能保留了之前运行写入的本数据集报告，检索时排除，避免条目检索到自己之前的结论；
+    # 只排除此刻已有的报告，本次运行写入的报告仍可被后续条目检索到
+    rag_tool.exclude_sources(adapter.report_dir)
+
+    # 已完成的条目
+    completed = store.completed_ids(name)
+    if not completed and os.path.exists(out_data_path):
+        n = _seed_store(store, adapter, out_data_path)
+        print(f"{name}: 从已有结果文件 {out_data_path} 导入 {n} 条结果")
+        completed = store.completed_ids(name)
+    print(f"{name}: 已完成 {len(completed)} 条数据，将跳过已完成条目继续。")
+
+    todo = (
+        (idx, item) for idx, item in enumerate(adapter.records())
+        if adapter.item_key(idx, item) not in completed
+    )
 
-    # 读取原始数据
-    with open(data_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    # data = data[:100]
-
-    # 检查已有的输出数据
-    processed_data = []
-    if os.path.exists(out_data_path):
-        with open(out_data_path, "r", encoding="utf-8") as f:
-            try:
-                processed_data = json.load(f)
-            except json.JSONDecodeError:
-                processed_data = []
-
-    # 已处理数量
-    start_idx = len(processed_data)
-    print(f"已处理 {start_idx}/{len(data)} 条数据，将从第 {start_idx} 条继续。")
-
-    out_data = processed_data[:]  # 拷贝已有结果
-
-    for idx, item in enumerate(data[start_idx:], start=start_idx):
-        img = os.path.join(img_dir, item['imagePath'])
-        instruction ="Identify content safety risks in image",   
-        input_data = {                     
-            "text": None,
-            "image": get_sample_image(img),
-            "audio": get_sample_audio(),
-            "video": get_sample_video()
-        }
-        result = run_safety_assessment(instruction,input_data)
+    def write_report(idx, result):
+        # 报告在工作线程中写出并加入案例库，后续样本即可检索到本次运行的案例
+        report_path = os.path.join(adapter.report_dir, f"{name}_{idx}.txt")
+        save_report(result, report_path)
+        if settings.RAG_INGEST_RESULTS:
+            rag_tool.ingest_report(report_path)
+
+    def assess(idx, item):
+        result = run_safety_assessment(adapter.instruction, adapter.build_input(item))
+        write_report(idx, result)
+        return result
+
+    async def aassess(idx, item):
+        result = await arun_safety_assessment(adapter.instruction, adapter.build_input(item))
+        # 写文件与入库（嵌入请求）是阻塞调用，放到线程池中执行
+        await asyncio.get_running_loop().run_in_executor(None, write_report, idx, result)
+        return result
+
+    done = len(completed)
+    token_usage = {}
+    stop_reasons = Counter()
+    turns_saved = 0
+
+    def record(idx, item, result):
+        nonlocal done, token_usage, turns_saved
+        item_id = adapter.item_key(idx, item)
 
         # 更新 item
         item["risk_decision"] = result["verdict"]["risk_decision"]
-        # item["raw_id"] = item['id']
-        item['id'] = idx
-
-        out_data.append(item)
-        save_report(result, f"result\\VHD11K\\report\\VHD11K_{idx}.txt")
-
-        # 每 batch 保存一次
-        if (idx + 1) % batch_size == 0 or idx == len(data) - 1:
-            with open(out_data_path, "w", encoding="utf-8") as f:
-                json.dump(out_data, f, ensure_ascii=False, indent=4)
-            print(f"已保存到 {out_data_path} (进度: {idx+1}/{len(data)})")
-
+        if result.get("image_stats"):
+            item["image_stats"] = result["image_stats"]
+        if result.get("triage"):
+            item["triage"] = result["triage"]
+        if result.get("debate_stats"):
+            item["debate_stats"] = result["debate_stats"]
+            stop_reasons[result["debate_stats"]["stop_reason"]] += 1
+            turns_saved += result["debate_stats"]["turns_saved"]
+        if result.get("token_usage"):
+            item["token_usage"] = result["token_usage"]
+            token_usage = merge_usage(token_usage, result["token_usage"])
+        adapter.update_item(idx, item, result)
+
+        store.append(name, item_id, idx, item)
+        done += 1
+
+        if done % batch_size == 0:
+            print(f"进度: 已完成 {done} 条，限流排队: {settings.get_rate_scheduler().queue_depth()}")
+
+    # 并发评估，结果按输入顺序返回
+    if use_async:
+        async def consume():
+            async for idx, item, result in arun_batch(todo, aassess, concurrency):
+                record(idx, item, result)
+        asyncio.run(consume())
+    else:
+        for idx, item, result in run_batch(todo, assess, concurrency):
+            record(idx, item, result)
+
+    # 导出 JSON 结果（按输入顺序）
+    n = store.export_json(name, out_data_path)
+    print(f"已导出 {n} 条结果到 {out_data_path}")
+
+    logger.info("限流统计: %s", settings.get_rate_scheduler().stats())
+    print(f"路由统计: {route_stats.stats()}")
+    if stop_reasons:
+        print(f"辩论结束原因: {dict(stop_reasons)}，共节省 {turns_saved} 次辩论发言")
+    if token_usage:
+        print(f"辩论/仲裁 token 用量: {token_usage}，前缀缓存命中率: {cache_hit_rate(token_usage):.1%}")
+    llm_cache = settings.get_llm_cache()
+    if llm_cache is not None:
+        print(f"LLM 缓存统计: {llm_cache.stats()}")
     print("全部处理完成 ✅")
 
-def main_txt_img(batch_size=50):
-    data_path = "data\\text_img\\data.json"
-    img_dir = "data/text_img/"
-    out_data_path = "result\\text_img\\text_img_output.json"
-    os.makedirs("result/text_img", exist_ok=True)
-
-    # 读取原始数据
-    with open(data_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    data = data[:300]
-
-    # 检查已有的输出数据
-    processed_data = []
-    if os.path.exists(out_data_path):
-        with open(out_data_path, "r", encoding="utf-8") as f:
-            try:
-                processed_data = json.load(f)
-            except json.JSONDecodeError:
-                processed_data = []
-
-    # 已处理数量
-    start_idx = len(processed_data)
-    print(f"已处理 {start_idx}/{len(data)} 条数据，将从第 {start_idx} 条继续。")
-
-    out_data = processed_data[:]  # 拷贝已有结果
-
-    for idx, item in enumerate(data[start_idx:], start=start_idx):
-        img = os.path.join(img_dir, item['image_path'])
-        instruction ="Assess whether the combination of text and image poses a content safety risk",   
-        input_data = {                     
-            "text": item['instruction'],
-            "image": get_sample_image(img),
-            "audio": get_sample_audio(),
-            "video": get_sample_video()
-        }
-        result = run_safety_assessment(instruction,input_data)
-
-        # 更新 item
-        item["risk_decision"] = result["verdict"]["risk_decision"]
-        # item["raw_id"] = item['id']
-        item['id'] = idx
-
-        out_data.append(item)
-        save_report(result, f"result\\text_img\\report\\text_img_{idx}.txt")
-
-        # 每 batch 保存一次
-        if (idx + 1) % batch_size == 0 or idx == len(data) - 1:
-            with open(out_data_path, "w", encoding="utf-8") as f:
-                json.dump(out_data, f, ensure_ascii=False, indent=4)
-            print(f"已保存到 {out_data_path} (进度: {idx+1}/{len(data)})")
-
-    print("全部处理完成 ✅")
+def main_test_text(batch_size=50, concurrency=None):
+    run(WildGuardAdapter(), batch_size=batch_size, concurrency=concurrency)
+
+def main_only_img(batch_size=50, concurrency=None):
+    run(VHD11KAdapter(), batch_size=batch_size, concurrency=concurrency)
+
+def main_txt_img(batch_size=50, concurrency=None):
+    run(TextImgAdapter(), batch_size=batch_size, concurrency=concurrency)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="多模态内容安全评估")
+    parser.add_argument("--dataset", choices=sorted(DATASET_ADAPTERS), default="text_img",
+                        help="数据集适配器")
+    parser.add_argument("--data-path", help="标注文件路径（JSON 数组或 JSONL）")
+    parser.add_argument("--media-dir", help="媒体文件根目录")
+    parser.add_argument("--limit", type=int, help="最多处理的条目数")
+    parser.add_argument("--out", help="导出的 JSON 结果路径")
+    parser.add_argument("--batch-size", type=int, default=2, help="每完成多少条打印一次进度")
+    parser.add_argument("--concurrency", type=int, help="并发评估数，默认使用 BATCH_CONCURRENCY")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="在单个事件循环中异步并发评估，不为每条数据占用一个工作线程")
+    # 仅 jsonl 适配器使用
+    parser.add_argument("--name", help="数据集名称（jsonl，默认使用数据文件名）")
+    parser.add_argument("--instruction", help="评估指令（jsonl）")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--image-field", default="image_path")
+    return parser.parse_args(argv)
+
+def build_adapter(args) -> DatasetAdapter:
+    """根据命令行参数构造数据集适配器"""
+    adapter_cls = DATASET_ADAPTERS[args.dataset]
+    kwargs = {}
+    if args.data_path:
+        kwargs["data_path"] = args.data_path
+    if args.media_dir:
+        kwargs["media_dir"] = args.media_dir
+    if args.limit is not None:
+        kwargs["limit"] = args.limit
+    if adapter_cls is JsonlAdapter:
+        if not args.data_path:
+            raise SystemExit("jsonl 数据集需要指定 --data-path")
+        kwargs.update(
+            name=args.name,
+            instruction=args.instruction,
+            id_field=args.id_field,
+            text_field=args.text_field,
+            image_field=args.image_field,
+        )
+    return adapter_cls(**kwargs)
 
 
 if __name__ == "__main__":
-
-    # main_test_text(batch_size=2)
-    # main_sample()
-    # main_only_img(batch_size=2)
-    main_txt_img(batch_size=2)
\ No newline at end of file
+    args = parse_args()
+    run(build_adapter(args), batch_size=args.batch_size,
+        concurrency=args.concurrency, out_data_path=args.out, use_async=args.use_async)
@@ -51,3 +51,18 @@ arbitrator_zh = """作为一名内容安全仲裁员，能够关注隐性风险
 [辩论历史中推理过程的详细总结]（200字）
 
 """
+
+
+# 接在共用前缀与辩论历史之后的仲裁指令
+arbitrator_task_en = """As a content safety arbitrator, please generate the final risk assessment report based on the user input above and the debaters' debate history.
+
+Report Requirements:
+Based on the user input and the viewpoints of both debaters, arbitrate the debate outcome and indicate whether a content safety risk exists (Yes/No). 
+Summarize the reasoning process from the debate history that supports the final conclusion.
+
+## Output Format:
+## Risk Exists: [Yes/No]
+## Reasoning:
+[Detailed summary of the reasoning process in the debate history] (200 words)
+
+"""
@@ -55,6 +55,21 @@ debate_next_en = (
     "\nThe output should be within 150 words."
 )
 
+# 开启辩论收敛判定时追加在 debate_next_en 之后，供判定器读取双方当前的风险标签
+debate_risk_label_en = (
+    "\nEnd your reply with a final line \"Risk Exists: Yes\" or \"Risk Exists: No\" stating your current judgement."
+)
+
+
+# 辩论与仲裁共用的稳定前缀，不包含轮次、角色等随调用变化的内容，以便命中提供方的前缀缓存
+case_context_en = """Content Safety Risk Assessment
 
+User Instruction:
+{instruction}
 
+User Input:
+{translated_text}
 
+Background Information:
+{background}
+"""
@@ -0,0 +1,9 @@
+# 规划者分诊：只有明确无风险或明确违规的输入才跳过背景检索与辩论
+triage_en = """Before any background retrieval or debate, triage the user input above for this content safety assessment.
+
+- "safe": the input is clearly benign under the user instruction, with no plausible explicit or implicit risk.
+- "unsafe": the input clearly and explicitly violates content safety policies.
+- "ambiguous": the judgement depends on context, named entities, implicit meaning, or the combination of modalities, or you are not sure.
+
+Only choose "safe" or "unsafe" when the case is clear-cut; otherwise choose "ambiguous".
+"""
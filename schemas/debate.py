@@ -0,0 +1,137 @@
+# schemas/debate.py
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from langchain_core.messages import HumanMessage
+
+from tools.bm25 import tokenize
+
+
+@dataclass
+class DebateTurn:
+    """一次辩论发言"""
+
+    role: str  # "strict" or "lenient"
+    name: str
+    round: int
+    attempt: int
+    text: str
+    tokens: int = 0  # 发言的 completion token 数，0 表示未知（按字符数估算）
+    _message: Optional[HumanMessage] = field(default=None, repr=False, compare=False)
+
+    def to_message(self) -> HumanMessage:
+        """渲染为提示消息（只渲染一次，各次调用复用同一内容以保持前缀缓存）"""
+        if self._message is None:
+            self._message = HumanMessage(
+                content=f"===={self.name} Round {self.round} viewpoint:====\n {self.text}\n"
+            )
+        return self._message
+
+    @property
+    def cost(self) -> int:
+        """作为历史放入提示时占用的 token 数"""
+        return self.tokens or len(self.text) // 4 + 1
+
+
+class DebateLog:
+    """辩论记录：按发言顺序保存 DebateTurn，并按角色索引最近一次发言
+
+    按角色记录最近一次发言的位置，history 不需要回溯或解析历史文本即可确定必须保留的发言；
+    只有在调用模型或写报告时才渲染为消息。
+    """
+
+    def __init__(self):
+        self.turns: List[DebateTurn] = []
+        self._latest: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def append(self, turn: DebateTurn) -> None:
+        self._latest[turn.role] = len(self.turns)
+        self.turns.append(turn)
+
+    def history(self, role: str, max_tokens: int) -> List[HumanMessage]:
+        """role 下一次发言时可见的辩论历史
+
+        从最近一次发言往前取，累计 token 数不超过 max_tokens；
+        其他角色最近一次发言及其之后的发言无论预算都会保留，保证辩论者总能看到对方的最新观点。
+        """
+        opponents = [i for r, i in self._latest.items() if r != role]
+        keep_from = max(opponents) if opponents else len(self.turns)
+        start, used = len(self.turns), 0
+        while start > 0:
+            cost = self.turns[start - 1].cost
+            if start - 1 < keep_from and used + cost > max_tokens:
+                break
+            used += cost
+            start -= 1
+        return [turn.to_message() for turn in self.turns[start:]]
+
+    def to_messages(self, last: Optional[int] = None) -> List[HumanMessage]:
+        turns = self.turns if last is None else self.turns[-last:]
+        return [turn.to_message() for turn in turns]
+
+
+_RISK_LABEL_RE = re.compile(r"risk exists\W*(yes|no)\b", re.IGNORECASE)
+
+
+def parse_risk_label(text: str) -> Optional[str]:
+    """取发言中最后一个 "Risk Exists: Yes/No" 标签，没有时返回 None"""
+    labels = _RISK_LABEL_RE.findall(text)
+    return labels[-1].capitalize() if labels else None
+
+
+class ConvergenceDetector:
+    """辩论收敛判定
+
+    每条发言写入历史后调用 observe，返回非 None 的停止原因时结束辩论：
+    - agreement：辩论者明确表示认同对方（原有的 "I agree with your viewpoint"）；
+    - label_agreement：所有角色最近一次给出的风险标签一致（从 min_rounds 轮开始生效）；
+    - repetition：新发言与任一已有发言的二元词组 Jaccard 相似度达到 repeat_threshold。
+    enabled=False 时只保留 agreement 判定。
+    """
+
+    def __init__(self, n_roles: int, enabled: bool = True, min_rounds: int = 1,
+                 repeat_threshold: float = 0.6):
+        self.n_roles = n_roles
+        self.enabled = enabled
+        self.min_rounds = min_rounds
+        self.repeat_threshold = repeat_threshold
+        self.labels: Dict[str, str] = {}
+        self._shingles: List[Set[tuple]] = []
+        self.turns = 0
+        self.rounds = 0
+        self.stop_reason: Optional[str] = None
+
+    @staticmethod
+    def _shingle(text: str) -> Set[tuple]:
+        tokens = tokenize(text)
+        return set(zip(tokens, tokens[1:])) or set((t,) for t in tokens)
+
+    def observe(self, role: str, round_num: int, text: str) -> Optional[str]:
+        self.turns += 1
+        self.rounds = round_num
+        if "I agree with your viewpoint" in text:
+            self.stop_reason = "agreement"
+            return self.stop_reason
+        if not self.enabled:
+            return None
+
+        shingles = self._shingle(text)
+        repeat = max(
+            (len(shingles & prev) / len(shingles | prev) for prev in self._shingles if shingles | prev),
+            default=0.0,
+        )
+        self._shingles.append(shingles)
+        label = parse_risk_label(text)
+        if label:
+            self.labels[role] = label
+
+        if repeat >= self.repeat_threshold:
+            self.stop_reason = "repetition"
+        elif (round_num >= self.min_rounds and len(self.labels) >= self.n_roles
+              and len(set(self.labels.values())) == 1):
+            self.stop_reason = "label_agreement"
+        return self.stop_reason
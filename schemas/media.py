@@ -0,0 +1,99 @@
+# schemas/media.py
+import base64
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class MediaRef:
+    """本地媒体文件引用
+
+    工作流状态中只保存路径、类型、大小和内容哈希，
+    文件内容仅在多模态调用真正需要时才读取并编码。
+    """
+
+    path: str
+    mime: str
+    size: int
+    _sha256: Optional[str] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_path(cls, path: Optional[str], mime: Optional[str] = None) -> Optional["MediaRef"]:
+        """为本地文件创建引用，文件不存在时返回 None"""
+        if not path or not os.path.exists(path):
+            return None
+        mime = mime or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return cls(path=path, mime=mime, size=os.path.getsize(path))
+
+    @property
+    def sha256(self) -> str:
+        """文件内容的 SHA-256（首次访问时流式计算）"""
+        if self._sha256 is None:
+            h = hashlib.sha256()
+            with open(self.path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            self._sha256 = h.hexdigest()
+        return self._sha256
+
+    @property
+    def kind(self) -> str:
+        """媒体大类：image / audio / video"""
+        return self.mime.split("/", 1)[0]
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.read_bytes()).decode("utf-8")
+
+    def summary(self) -> str:
+        """供文本提示与日志使用的简短描述"""
+        return (
+            f"[{self.kind}: {os.path.basename(self.path)}, {self.mime}, "
+            f"{self.size / 1024:.1f} KB]"
+        )
+
+    def __str__(self) -> str:
+        return self.summary()
+
+
+def has_media(value: Any) -> bool:
+    """判断输入字段是否包含媒体（MediaRef 或非空的 base64 字符串）"""
+    if isinstance(value, MediaRef):
+        return True
+    return isinstance(value, str) and bool(value.strip())
+
+
+def media_to_base64(value: Any) -> Optional[str]:
+    """取得媒体的 base64 编码；兼容直接传入 base64 字符串的旧调用方式"""
+    if isinstance(value, MediaRef):
+        return value.to_base64()
+    return value or None
+
+
+def media_mime(value: Any, default: str) -> str:
+    if isinstance(value, MediaRef) and value.mime != "application/octet-stream":
+        return value.mime
+    return default
+
+
+MEDIA_FIELDS = ("image", "audio", "video")
+
+
+def summarize_raw_input(raw_input: Dict[str, Any], max_len: int = 100) -> Dict[str, Any]:
+    """将原始输入转换为适合放进文本提示的简要形式（媒体只保留摘要，文本保持不变）"""
+    summary = {}
+    for k, v in (raw_input or {}).items():
+        if isinstance(v, MediaRef):
+            summary[k] = v.summary()
+        elif k in MEDIA_FIELDS and isinstance(v, str) and len(v) > max_len:
+            # 旧调用方式直接传入的 base64 字符串
+            summary[k] = f"[{k}: base64, {len(v)} 字符]"
+        else:
+            summary[k] = v
+    return summary
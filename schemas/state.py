@@ -2,6 +2,8 @@
 from typing import TypedDict, Annotated, Sequence, List, Dict, Any
 import operator
 from langchain_core.messages import BaseMessage
+from utils.prompt_cache import merge_usage
+from schemas.debate import DebateLog
 
 class AgentState(TypedDict):
     """工作流状态定义"""
@@ -16,13 +18,29 @@ class AgentState(TypedDict):
     
     # 转换后的文本描述
     translated_text: str
+
+    # 图片规范化统计（尺寸与视觉 token 估算）
+    image_stats: Dict[str, Any]
+    
+    # 规划者分诊结果（label / confidence / reason / latency_ms）与下一步路由
+    triage: Dict[str, Any]
+    next: str
     
     # 支持者收集的背景信息
     background: str
     
-    # 辩论历史
+    # 辩论记录（按角色索引最近一次发言）
+    debate_log: DebateLog
+    
+    # 辩论历史（由辩论记录渲染，供仲裁者与报告使用）
     debate_history: Annotated[Sequence[BaseMessage], operator.add]
     
+    # 辩论与仲裁的 token 用量（calls / prompt_tokens / cached_tokens / completion_tokens，各节点累加）
+    token_usage: Annotated[Dict[str, int], merge_usage]
+    
+    # 辩论统计（rounds_run / rounds_saved / turns_saved / stop_reason）
+    debate_stats: Dict[str, Any]
+    
     # 最终裁决和报告
     verdict: Dict[str, str]
     
@@ -0,0 +1,33 @@
+# tests/test_batch.py
+import asyncio
+import time
+
+import pytest
+
+from utils.batch import arun_batch, run_batch
+
+
+def test_run_batch_yields_in_input_order():
+    def worker(idx, item):
+        time.sleep(0.01 * (5 - idx))
+        return item * 2
+
+    results = list(run_batch(enumerate(range(5)), worker, concurrency=3))
+    assert [(idx, result) for idx, _, result in results] == [(i, i * 2) for i in range(5)]
+
+
+def test_arun_batch_yields_in_input_order_and_reraises():
+    async def worker(idx, item):
+        await asyncio.sleep(0.01 * (5 - idx))
+        if idx == 3:
+            raise RuntimeError("boom")
+        return item * 2
+
+    async def collect(out):
+        async for idx, _, result in arun_batch(enumerate(range(5)), worker, concurrency=3):
+            out.append((idx, result))
+
+    out = []
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(out))
+    assert out == [(0, 0), (1, 2), (2, 4)]
@@ -0,0 +1,41 @@
+# tests/test_bm25.py
+import math
+
+import pytest
+
+from tools.bm25 import BM25Index, tokenize
+
+
+def test_tokenize_mixes_english_words_and_cjk_bigrams():
+    assert tokenize("Hate speech 仇恨言论 X") == ["hate", "speech", "仇恨", "恨言", "言论", "x"]
+    assert tokenize("枪") == ["枪"]
+
+
+def test_search_scores_match_bm25_formula():
+    index = BM25Index(k1=1.5, b=0.75)
+    index.add_many([(0, "violent threat threat"), (1, "weather report"), (2, "threat model")])
+    hits = index.search("threat", k=5)
+    assert [doc for doc, _ in hits] == [0, 2]
+
+    n, df, avg_len = 3, 2, 7 / 3
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    norm = 1.5 * (1 - 0.75 + 0.75 * 3 / avg_len)
+    assert hits[0][1] == pytest.approx(idf * 2 * 2.5 / (2 + norm))
+
+
+def test_remove_and_replace_documents():
+    index = BM25Index()
+    index.add_many([(0, "alpha beta"), (1, "beta gamma")])
+    index.remove(0)
+    assert [doc for doc, _ in index.search("alpha beta")] == [1]
+    index.add(1, "delta")
+    assert index.search("beta") == [] and len(index) == 1
+
+
+def test_terms_in_most_documents_are_ignored():
+    # 超过 max_df 比例的词（如报告模板表头）不参与打分
+    docs = [(i, f"report header case{i}") for i in range(20)]
+    index = BM25Index(max_df=0.5)
+    index.add_many(docs)
+    assert index.search("report header") == []
+    assert [doc for doc, _ in index.search("report case7")] == [7]
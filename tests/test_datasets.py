@@ -0,0 +1,45 @@
+# tests/test_datasets.py
+import json
+
+import pytest
+
+from utils.datasets import DatasetAdapter, JsonlAdapter, iter_json_array
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 7, 1 << 16])
+def test_iter_json_array_scalars_across_chunk_boundaries(tmp_path, chunk_size):
+    path = tmp_path / "data.json"
+    path.write_text('[1, 23456, 3.5, "x", null, true, -1e10]', encoding="utf-8")
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == [1, 23456, 3.5, "x", None, True, -1e10]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16])
+def test_iter_json_array_objects(tmp_path, chunk_size):
+    items = [{"id": i, "text": "样本 %d" % i, "tags": [i, i * 10]} for i in range(20)]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == items
+
+
+def test_iter_json_array_rejects_truncated_file(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text('[1, 2, 3', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), chunk_size=2))
+
+
+def test_adapter_without_build_input_cannot_be_instantiated():
+    class Incomplete(DatasetAdapter):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete("data.json")
+
+
+def test_jsonl_adapter_defaults_name_to_file_stem(tmp_path):
+    path = tmp_path / "reviews_2024.jsonl"
+    path.write_text('{"id": "a", "text": "x"}\n\n{"id": "b", "text": "y"}\n', encoding="utf-8")
+    adapter = JsonlAdapter(str(path), limit=1)
+    assert adapter.name == "reviews_2024"
+    assert JsonlAdapter(str(path), name="custom").name == "custom"
+    assert list(adapter.records()) == [{"id": "a", "text": "x"}]
@@ -0,0 +1,73 @@
+# tests/test_debate.py
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from schemas.debate import ConvergenceDetector, DebateLog, DebateTurn, parse_risk_label
+
+
+def _log(*turns):
+    log = DebateLog()
+    for i, (role, tokens) in enumerate(turns):
+        log.append(DebateTurn(role=role, name=role, round=i // 2 + 1, attempt=1,
+                              text=f"turn {i}", tokens=tokens))
+    return log
+
+
+def _texts(messages):
+    return [m.content.split("\n ")[1].strip() for m in messages]
+
+
+def test_history_keeps_recent_turns_within_budget():
+    log = _log(("strict", 100), ("lenient", 100), ("strict", 100), ("lenient", 100))
+    assert _texts(log.history("strict", 250)) == ["turn 2", "turn 3"]
+    assert _texts(log.history("strict", 1000)) == ["turn 0", "turn 1", "turn 2", "turn 3"]
+
+
+def test_history_always_keeps_latest_opponent_turn():
+    log = _log(("strict", 100), ("lenient", 500), ("strict", 500))
+    # 预算不足时仍保留对方（lenient）最近一次发言及其之后的发言
+    assert _texts(log.history("strict", 10)) == ["turn 1", "turn 2"]
+    assert _texts(log.history("lenient", 10)) == ["turn 2"]
+
+
+def test_history_is_empty_before_any_turn_and_messages_are_rendered_once():
+    log = DebateLog()
+    assert log.history("strict", 100) == []
+    log.append(DebateTurn(role="strict", name="Strict", round=1, attempt=1, text="x"))
+    assert len(log) == 1
+    assert log.turns[0].cost == 1
+    assert log.history("lenient", 100)[0] is log.to_messages()[0]
+
+
+def test_parse_risk_label_takes_the_last_label():
+    assert parse_risk_label("Risk Exists: no ... on reflection, **Risk Exists**: YES") == "Yes"
+    assert parse_risk_label("no label here") is None
+
+
+def test_detector_stops_on_explicit_agreement_even_when_disabled():
+    detector = ConvergenceDetector(n_roles=2, enabled=False)
+    assert detector.observe("strict", 1, "Risk Exists: Yes") is None
+    assert detector.observe("lenient", 1, "I agree with your viewpoint.") == "agreement"
+    assert (detector.turns, detector.rounds) == (2, 1)
+
+
+def test_detector_stops_when_all_latest_labels_agree_after_min_rounds():
+    detector = ConvergenceDetector(n_roles=2, min_rounds=2)
+    assert detector.observe("strict", 1, "weapons are shown. Risk Exists: Yes") is None
+    assert detector.observe("lenient", 1, "only a toy gun. Risk Exists: Yes") is None  # 未到 min_rounds
+    assert detector.observe("strict", 2, "the caption urges violence. Risk Exists: Yes") == "label_agreement"
+
+
+def test_detector_keeps_going_while_labels_differ():
+    detector = ConvergenceDetector(n_roles=2)
+    assert detector.observe("strict", 1, "graphic injury imagery. Risk Exists: Yes") is None
+    assert detector.observe("lenient", 1, "medical textbook context. Risk Exists: No") is None
+    assert detector.stop_reason is None
+
+
+def test_detector_stops_on_repeated_argument():
+    detector = ConvergenceDetector(n_roles=2, repeat_threshold=0.6)
+    text = "the image depicts a protest with raised fists and banners in a city square"
+    assert detector.observe("strict", 1, text) is None
+    assert detector.observe("lenient", 1, "as said, " + text) == "repetition"
@@ -0,0 +1,54 @@
+# tests/test_embedding_service.py
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from tools.embedding_service import EmbeddingService
+
+
+class _RecordingEmbeddings:
+    """记录每次请求的文本，向量为 [长度, 首字符编码]"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), float(ord(t[0]))] for t in texts]
+
+
+def test_duplicates_are_embedded_once_and_batched():
+    base = _RecordingEmbeddings()
+    service = EmbeddingService(base, "m", batch_size=2)
+    vectors = service.embed_documents(["header", "a", "header", "bb", "ccc"])
+    assert base.calls == [["header", "a"], ["bb", "ccc"]]
+    assert vectors[0] == vectors[2] == [6.0, float(ord("h"))]
+    assert service.stats()["misses"] == 4
+
+
+def test_disk_cache_is_shared_across_instances_and_keyed_by_model(tmp_path):
+    db = str(tmp_path / "emb.db")
+    first = _RecordingEmbeddings()
+    EmbeddingService(first, "m", db_path=db).embed_documents(["alpha", "beta"])
+
+    second = _RecordingEmbeddings()
+    service = EmbeddingService(second, "m", db_path=db)
+    assert service.embed_documents(["beta", "gamma"]) == [[4.0, 98.0], [5.0, 103.0]]
+    assert second.calls == [["gamma"]]
+
+    other_model = _RecordingEmbeddings()
+    EmbeddingService(other_model, "other", db_path=db).embed_documents(["alpha"])
+    assert other_model.calls == [["alpha"]]
+
+
+def test_query_lru_avoids_repeat_requests_and_evicts_oldest():
+    base = _RecordingEmbeddings()
+    service = EmbeddingService(base, "m", query_cache_size=2)
+    service.embed_query("q1")
+    service.embed_query("q2")
+    service.embed_query("q1")
+    assert base.calls == [["q1"], ["q2"]]
+    service.embed_query("q3")  # 淘汰最久未使用的 q2
+    service.embed_query("q2")
+    assert base.calls[-1] == ["q2"]
+    assert service.stats()["cached_queries"] == 2
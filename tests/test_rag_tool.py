@@ -0,0 +1,103 @@
+# tests/test_rag_tool.py
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_text_splitters")
+
+from tools.bm25 import BM25Index
+from tools.rag_tool import RAGTool
+from tools.vector_index import PersistentVectorIndex
+
+
+class _CharEmbeddings:
+    """按字符计数生成的确定性向量，不访问网络"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.zeros(32)
+        for ch in text:
+            vector[ord(ch) % 32] += 1
+        return vector
+
+
+class _WholeText:
+    def split_text(self, text):
+        return [text]
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    tool = RAGTool()
+    tool.index = PersistentVectorIndex(str(tmp_path / "index"))
+    tool.bm25 = BM25Index()
+    monkeypatch.setattr(tool, "_get_embeddings", lambda: _CharEmbeddings())
+    monkeypatch.setattr(tool, "_get_splitter", lambda: _WholeText())
+    monkeypatch.setattr(tool, "start_warmup", lambda: None)
+    tool._ready.set()
+    return tool
+
+
+def _write_report(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_reports_from_current_run_are_retrievable(rag, tmp_path):
+    report_dir = tmp_path / "reports"
+    report_dir.mkdir()
+    old = _write_report(report_dir / "ds_0.txt", "previous verdict for item zero", 1000)
+    rag.ingest_report(old)
+
+    rag.exclude_sources(str(report_dir))
+    new = _write_report(report_dir / "ds_1.txt", "current verdict for item one", 2000)
+    assert rag.ingest_report(new) == 1
+
+    docs = rag.retrieve("verdict for item", k=4)
+    assert [doc.metadata["filename"] for doc in docs] == ["ds_1.txt"]
+
+
+def test_rewritten_report_is_no_longer_excluded(rag, tmp_path):
+    report_dir = tmp_path / "reports"
+    report_dir.mkdir()
+    path = _write_report(report_dir / "ds_0.txt", "previous verdict for item zero", 1000)
+    rag.ingest_report(path)
+    rag.exclude_sources(str(report_dir))
+    assert rag.retrieve("verdict for item", k=4) == []
+
+    _write_report(report_dir / "ds_0.txt", "rerun verdict for item zero", 2000)
+    rag.ingest_report(path)
+    assert [doc.metadata["filename"] for doc in rag.retrieve("verdict for item", k=4)] == ["ds_0.txt"]
+
+
+def test_lexically_decisive_needs_a_clear_gap_after_k(rag):
+    assert rag._lexically_decisive([(0, 3.0), (1, 1.0)], k=1)
+    assert not rag._lexically_decisive([(0, 1.2), (1, 1.0)], k=1)
+    assert not rag._lexically_decisive([(0, 3.0)], k=1)
+
+
+def test_decisive_bm25_hits_skip_the_query_embedding(rag, tmp_path, monkeypatch):
+    texts = ["gambling gambling odds casino", "casino night", "casino bus"]
+    for i, text in enumerate(texts):
+        rag.ingest_report(_write_report(tmp_path / f"r{i}.txt", text, 1000 + i))
+
+    def no_query_embedding(self, text):
+        raise AssertionError("query embedding requested")
+
+    monkeypatch.setattr(_CharEmbeddings, "embed_query", no_query_embedding)
+    docs = rag.retrieve("gambling odds casino", k=1)
+    assert [(d.metadata["filename"], d.metadata["retrieval"]) for d in docs] == [("r0.txt", "bm25")]
+
+
+def test_close_bm25_scores_are_reranked_by_vector(rag, tmp_path):
+    texts = ["casino night", "casino bus", "casino town"]
+    for i, text in enumerate(texts):
+        rag.ingest_report(_write_report(tmp_path / f"r{i}.txt", text, 1000 + i))
+    # 三个候选的 BM25 分数相同，需要查询向量重排
+    docs = rag.retrieve("casino", k=1)
+    assert [d.metadata["retrieval"] for d in docs] == ["bm25+vector"]
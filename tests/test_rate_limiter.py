@@ -0,0 +1,50 @@
+# tests/test_rate_limiter.py
+import email.utils
+import time
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from utils.rate_limiter import DeploymentLimiter, TokenBucket, parse_retry_after
+
+
+def test_token_bucket_wait_time_and_refill():
+    bucket = TokenBucket(capacity=10, rate=2)
+    now = bucket.updated
+    assert bucket.wait_time(10, now) == 0
+    bucket.consume(10)
+    assert bucket.wait_time(1, now) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 0.5) == 0
+    # 超过容量的请求按容量计算，不会永远等待
+    assert bucket.wait_time(100, now + 0.5) == pytest.approx((10 - 1) / 2)
+
+
+def test_deployment_limiter_capacity_is_one_quota_window():
+    limiter = DeploymentLimiter("gpt", rpm=60)
+    assert [limiter.acquire(blocking=False) for _ in range(11)] == [True] * 10 + [False]
+    assert limiter.stats()["requests"] == 10
+
+
+def test_deployment_limiter_corrects_token_estimate():
+    limiter = DeploymentLimiter("gpt", rpm=600, tpm=6000, initial_tokens=500)
+    assert limiter.acquire(blocking=False)
+    limiter.record_usage(100)
+    assert limiter.tokens.tokens == pytest.approx(1000 - 100, abs=1)
+    assert limiter.avg_tokens == pytest.approx(0.8 * 500 + 0.2 * 100)
+
+
+def test_rate_limited_deployment_blocks_new_requests():
+    limiter = DeploymentLimiter("gpt", rpm=600)
+    limiter.on_rate_limited(30)
+    assert not limiter.acquire(blocking=False)
+    assert limiter.stats()["rate_limited"] == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert parse_retry_after({"retry-after": "7"}) == 7.0
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < parse_retry_after({"retry-after": date}) <= 60
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
@@ -0,0 +1,12 @@
+# tests/test_result_store.py
+from utils.result_store import ResultStore
+
+
+def test_append_many_keeps_existing_rows(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.append("ds", "1", 1, {"id": 1, "risk_decision": "Yes"})
+    n = store.append_many("ds", [("0", 0, {"id": 0, "risk_decision": "No"}),
+                                 ("1", 1, {"id": 1, "risk_decision": "No"})])
+    assert n == 1
+    assert store.completed_ids("ds") == {"0", "1"}
+    assert [item["risk_decision"] for item in store.query("ds")] == ["No", "Yes"]
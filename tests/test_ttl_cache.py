@@ -0,0 +1,73 @@
+# tests/test_ttl_cache.py
+import threading
+import time
+
+import pytest
+
+from utils.ttl_cache import TTLCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TTLCache(str(tmp_path / "cache.db"), ttl=60)
+
+
+def test_get_or_compute_shares_one_inflight_computation(cache):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["url"]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+                 for _ in range(3)]
+    for t in followers:
+        t.start()
+    while cache.stats()["shared_inflight"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join()
+
+    assert calls == [1]
+    assert results == [["url"]] * 4
+    assert cache.get("k") == ["url"]
+
+
+def test_empty_results_are_not_cached(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return []
+
+    assert cache.get_or_compute("k", compute) == []
+    assert cache.get_or_compute("k", compute) == []
+    assert len(calls) == 2
+    assert cache.get("k") is None
+    assert cache.get_or_compute("k2", compute, should_cache=lambda v: True) == []
+    assert cache.get("k2") == []
+
+
+def test_failures_propagate_to_waiters_and_are_not_cached(cache):
+    def compute():
+        raise RuntimeError("search failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", compute)
+    assert cache.get("k") is None
+    assert cache.get_or_compute("k", lambda: ["ok"]) == ["ok"]
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("k", ["old"], ttl=-1)
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,86 @@
+# tests/test_vector_index.py
+import os
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from tools.vector_index import PersistentVectorIndex
+
+
+def _index_with_one_file(path):
+    index = PersistentVectorIndex(str(path))
+    vectors = np.random.default_rng(0).standard_normal((3, 8))
+    index.add_file("a.txt", "sha", 1.0, 10, ["x", "y", "z"], vectors)
+    return index
+
+
+def test_uncommitted_tail_is_truncated(tmp_path):
+    index = _index_with_one_file(tmp_path)
+    size = os.path.getsize(index.vectors_path)
+    with open(index.vectors_path, "ab") as f:
+        f.write(b"\0" * 5 * index.dim * index.dtype.itemsize)
+
+    reopened = PersistentVectorIndex(str(tmp_path))
+    assert reopened.rows == 3
+    assert os.path.getsize(reopened.vectors_path) == size
+    assert "a.txt" in reopened.file_states()
+
+
+def test_short_vector_file_resets_index(tmp_path):
+    index = _index_with_one_file(tmp_path)
+    os.truncate(index.vectors_path, index.dim * index.dtype.itemsize)
+
+    reopened = PersistentVectorIndex(str(tmp_path))
+    assert reopened.rows == 0
+    assert reopened.file_states() == {}
+
+
+def test_search_skips_excluded_rows(tmp_path):
+    index = _index_with_one_file(tmp_path)
+    query = index.matrix()[1]
+    assert index.search(query, k=1)[0][0] == 1
+    hits = index.search(query, k=3, exclude={1})
+    assert [row for row, _ in hits if row == 1] == []
+    assert len(hits) == 2
+    assert sorted(row for row, _ in index.live_sources()) == [0, 1, 2]
+
+
+def test_ivf_trains_in_background_and_exact_search_serves_meanwhile(tmp_path):
+    index = PersistentVectorIndex(str(tmp_path), search_mode="ivf")
+    vectors = np.random.default_rng(0).standard_normal((200, 8))
+    index.add_file("a.txt", "sha", 1.0, 10, ["x"] * 200, vectors)
+    query = index.matrix()[7]
+
+    assert index.search(query, k=1)[0][0] == 7
+    index._ivf_thread.join()
+    assert index._ivf is not None and index._ivf.rows == 200
+    assert index.search(query, k=1)[0][0] == 7
+
+
+def test_compaction_renumbers_rows_and_waits_for_readers(tmp_path):
+    index = PersistentVectorIndex(str(tmp_path))
+    rng = np.random.default_rng(0)
+    index.add_file("a.txt", "sha-a", 1.0, 10, ["a0", "a1", "a2"], rng.standard_normal((3, 8)))
+    index.add_file("b.txt", "sha-b", 1.0, 10, ["b0", "b1"], rng.standard_normal((2, 8)))
+    query = np.array(index.matrix()[4], dtype=np.float32)
+    index.remove_file("a.txt")
+
+    with index._lock:
+        index._acquire_matrix()
+    compactor = threading.Thread(target=index.maybe_compact)
+    compactor.start()
+    compactor.join(0.2)
+    assert compactor.is_alive()  # 读者未结束前不会替换向量文件
+    index._release_matrix()
+    compactor.join()
+
+    assert index.rows == 2 and index.live_count == 2
+    assert os.path.getsize(index.vectors_path) == 2 * index.dim * index.dtype.itemsize
+    row, _ = index.search(query, k=1)[0]
+    assert index.chunks([row]) == {row: ("b.txt", "b1")}
+
+    reopened = PersistentVectorIndex(str(tmp_path))
+    assert reopened.rows == 2
+    assert sorted(text for _, text in reopened.iter_live_chunks()) == ["b0", "b1"]
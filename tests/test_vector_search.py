@@ -0,0 +1,41 @@
+# tests/test_vector_search.py
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from tools.vector_search import IVFIndex, _random_matrix, exact_top_k
+
+
+def test_exact_top_k_skips_deleted_rows():
+    matrix = _random_matrix(1000, 16, "float32")
+    deleted = np.zeros(1000, dtype=bool)
+    deleted[7] = True
+    rows, scores = exact_top_k(matrix, matrix[7], 3, deleted=deleted, block_rows=128)
+    assert 7 not in rows
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("use_snapshot", [True, False])
+def test_ivf_search_with_rows_added_after_snapshot(use_snapshot):
+    matrix = _random_matrix(3000, 16, "float32")
+    old, deleted = matrix[:2000], np.zeros(2000, dtype=bool)
+    ivf = IVFIndex.train(old, nlist=16)
+    snapshot = ivf.snapshot()
+
+    # 另一个线程在检索前为新增行分配了簇
+    ivf.add(matrix)
+    assert ivf.rows == 3000
+
+    rows, _ = ivf.search(old, matrix[2500], 5, nprobe=16, deleted=deleted,
+                         snapshot=snapshot if use_snapshot else None)
+    assert len(rows) == 5
+    assert rows.max() < 2000
+
+
+def test_ivf_recall_with_all_lists_probed():
+    matrix = _random_matrix(5000, 32, "float32")
+    ivf = IVFIndex.train(matrix, nlist=32)
+    query = matrix[42]
+    exact, _ = exact_top_k(matrix, query, 10)
+    approx, _ = ivf.search(matrix, query, 10, nprobe=32)
+    assert set(approx) == set(exact)
@@ -1,19 +1,22 @@
 import asyncio
-from typing import List
+import atexit
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Union
 from pathlib import Path
 import sys
 
 from PicImageSearch import BaiDu, Network
 from PicImageSearch.model import BaiDuResponse
 
+from schemas.media import MediaRef
+from utils.logger import get_logger
+from config import settings
 
-async def _search_image_urls_async(
-    image_path: Path, max_results: int = 10
-) -> List[str]:
-    async with Network() as client:
-        baidu = BaiDu(client=client)
-        resp: BaiDuResponse = await baidu.search(file=image_path)
+logger = get_logger(__name__)
 
+
+def _extract_urls(resp: BaiDuResponse, max_results: int = 10) -> List[str]:
     urls: List[str] = []
 
     if resp.exact_matches:
@@ -37,8 +40,137 @@ async def _search_image_urls_async(
     return unique_urls[:max_results] if max_results > 0 else unique_urls
 
 
+class ImageSearchClient:
+    """以图搜图客户端
+
+    在一个常驻后台线程的事件循环上复用同一个 PicImageSearch Network（连接池与 TLS 会话），
+    用信号量限制同时进行的搜索数；结果按图片内容哈希缓存，同一图片的并发搜索只请求一次。
+    同步接口可在任意工作线程中调用，异步接口可在任意事件循环中 await。
+    """
+
+    def __init__(self, max_concurrency: int = 4, fetch_results: int = 10):
+        self.max_concurrency = max_concurrency
+        self.fetch_results = fetch_results
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # 以下对象只在后台事件循环中访问
+        self._network: Optional[Network] = None
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name="image-search-loop", daemon=True
+                )
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    async def _get_client(self):
+        if self._client is None:
+            self._network = Network()
+            self._client = await self._network.__aenter__()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _search(self, image_path: Path, key: str) -> List[str]:
+        """在后台事件循环中执行：同一图片的并发请求共享一个搜索任务
+
+        每个调用方都通过 shield 等待共享任务，某个调用方超时或被取消不会中断搜索，
+        也不会让合并到同一任务上的其他调用方失败。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(image_path, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._search_done(key, t))
+        return await asyncio.shield(task)
+
+    def _search_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有调用方都已取消时避免 “exception was never retrieved” 警告
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("以图搜图失败: %s", task.exception())
+
+    async def _fetch(self, image_path: Path, key: str) -> List[str]:
+        client = await self._get_client()
+        async with self._semaphore:
+            resp: BaiDuResponse = await BaiDu(client=client).search(file=image_path)
+        urls = _extract_urls(resp, self.fetch_results)
+        if urls:
+            # SQLite 写入是阻塞调用，放到线程池中执行，不占用共享事件循环
+            await asyncio.get_running_loop().run_in_executor(
+                None, settings.get_search_cache().set, key, urls
+            )
+        return urls
+
+    def _submit(self, image: Union[Path, str, MediaRef]) -> Future:
+        """在调用方线程中计算内容哈希并查缓存，未命中时把搜索提交到后台事件循环"""
+        ref = image if isinstance(image, MediaRef) else MediaRef.from_path(str(image))
+        if ref is None:
+            raise FileNotFoundError(f"文件不存在: {image}")
+        key = f"baidu_image:{ref.sha256}"
+        urls = settings.get_search_cache().get(key)
+        if urls is not None:
+            future = Future()
+            future.set_result(urls)
+            return future
+        return asyncio.run_coroutine_threadsafe(
+            self._search(Path(ref.path), key), self._get_loop()
+        )
+
+    @staticmethod
+    def _trim(urls: List[str], max_results: int) -> List[str]:
+        return urls[:max_results] if max_results > 0 else urls
+
+    def search(self, image: Union[Path, str, MediaRef], max_results: int = 10,
+               timeout: Optional[float] = None) -> List[str]:
+        """同步接口（线程安全），阻塞直到搜索完成"""
+        return self._trim(self._submit(image).result(timeout), max_results)
+
+    async def asearch(self, image: Union[Path, str, MediaRef], max_results: int = 10) -> List[str]:
+        """异步接口，可在任意事件循环中调用
+
+        _submit 中的文件哈希与 SQLite 缓存查询是阻塞调用，在线程池中执行，不占用调用方的事件循环。
+        """
+        future = await asyncio.get_running_loop().run_in_executor(None, self._submit, image)
+        return self._trim(await asyncio.wrap_future(future), max_results)
+
+    def close(self) -> None:
+        """关闭共享连接并停止后台事件循环"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            if self._network is not None:
+                await self._network.__aexit__(None, None, None)
+            self._network = self._client = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        except Exception as e:
+            logger.debug("关闭以图搜图客户端出错: %s", e)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+image_search_client = ImageSearchClient(max_concurrency=settings.IMAGE_SEARCH_CONCURRENCY)
+atexit.register(image_search_client.close)
+
+
 def search_image_urls(image_path: Path, max_results: int = 10) -> List[str]:
-    return asyncio.run(_search_image_urls_async(image_path, max_results=max_results))
+    return image_search_client.search(image_path, max_results=max_results)
+
+
+async def search_image_urls_async(image_path: Path, max_results: int = 10) -> List[str]:
+    return await image_search_client.asearch(image_path, max_results=max_results)
 
 
 def main() -> None:
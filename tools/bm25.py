@@ -0,0 +1,96 @@
+# tools/bm25.py
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# 英文/数字按单词切分；中日韩文字按相邻二字切分（单字成段时保留单字）
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[㐀-鿿豈-﫿぀-ヿ가-힯]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿぀-ヿ가-힯]")
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词：英文单词 + 中文字二元组"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """进程内 BM25 倒排索引，支持增量添加与删除文档
+
+    倒排表为 term -> {doc_id: tf}，删除文档的代价只与该文档的词数有关。
+    出现在超过 max_df 比例文档中的词（如报告模板中的固定表头）在检索时忽略。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: Dict[int, Counter] = {}
+        self._doc_len: Dict[int, int] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, doc_id: int, text: str) -> None:
+        terms = Counter(tokenize(text))
+        with self._lock:
+            if doc_id in self._doc_len:
+                self.remove(doc_id)
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            self._doc_terms[doc_id] = terms
+            length = sum(terms.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def add_many(self, docs: Iterable[Tuple[int, str]]) -> None:
+        for doc_id, text in docs:
+            self.add(doc_id, text)
+
+    def remove(self, doc_id: int) -> None:
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query: str, k: int = 50) -> List[Tuple[int, float]]:
+        """返回 BM25 分数最高的 k 个 (doc_id, score)，按分数降序；没有词重叠的文档不返回"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._doc_len)
+            if not n or not terms:
+                return []
+            avg_len = self._total_len / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                if n > 10 and df > self.max_df * n:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
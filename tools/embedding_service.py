@@ -0,0 +1,171 @@
+# tools/embedding_service.py
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model  TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, sha256)
+);
+"""
+
+# 单条 SQL 中 IN (...) 的参数上限
+_LOOKUP_BATCH = 500
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingService(Embeddings):
+    """带内容哈希缓存的嵌入服务
+
+    - 文本按 SHA-256 去重，同一批次或历史上已嵌入过的文本块（如报告模板中的固定表头）不再重复请求；
+    - 未命中的文本按 batch_size 合并为尽可能少的请求；
+    - 查询向量额外保存在进程内 LRU 中，重复的历史案例检索不访问网络也不查库。
+    """
+
+    def __init__(self, base: Embeddings, model: str, db_path: Optional[str] = None,
+                 batch_size: int = 512, query_cache_size: int = 1024):
+        self.base = base
+        self.model = model
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 磁盘缓存 ----------
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        if not self.db_path or not hashes:
+            return {}
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(hashes), _LOOKUP_BATCH):
+            part = hashes[i:i + _LOOKUP_BATCH]
+            rows = conn.execute(
+                f"SELECT sha256, vector FROM embeddings WHERE model = ? "
+                f"AND sha256 IN ({','.join('?' * len(part))})",
+                [self.model, *part],
+            )
+            for sha, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[sha] = vector.tolist()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        if not self.db_path or not vectors:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, sha256, vector) VALUES (?, ?, ?)",
+                [(self.model, sha, array("f", vec).tobytes()) for sha, vec in vectors.items()],
+            )
+
+    def _plan(self, texts: List[str]):
+        """返回 (每条文本的哈希, 已缓存的向量, 需要请求的 [(哈希, 文本)])"""
+        hashes = [_text_hash(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+        cached = self._lookup(list(unique))
+        missing = [(sha, text) for sha, text in unique.items() if sha not in cached]
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return hashes, cached, missing
+
+    def _batches(self, missing):
+        for i in range(0, len(missing), self.batch_size):
+            yield missing[i:i + self.batch_size]
+
+    # ---------- Embeddings 接口 ----------
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, vectors, missing = self._plan(texts)
+        for batch in self._batches(missing):
+            result = self.base.embed_documents([text for _, text in batch])
+            fresh = {sha: vec for (sha, _), vec in zip(batch, result)}
+            self._store(fresh)
+            vectors.update(fresh)
+        if missing:
+            logger.debug("嵌入 %d 条文本，其中 %d 条需要请求", len(texts), len(missing))
+        return [vectors[sha] for sha in hashes]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, vectors, missing = self._plan(texts)
+        for batch in self._batches(missing):
+            result = await self.base.aembed_documents([text for _, text in batch])
+            fresh = {sha: vec for (sha, _), vec in zip(batch, result)}
+            self._store(fresh)
+            vectors.update(fresh)
+        return [vectors[sha] for sha in hashes]
+
+    def _cached_query(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.hits += 1
+            return vector
+
+    def _remember_query(self, text: str, vector: List[float]) -> None:
+        with self._lock:
+            self._queries[text] = vector
+            self._queries.move_to_end(text)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cached_query(text)
+        if vector is None:
+            vector = self.embed_documents([text])[0]
+            self._remember_query(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._cached_query(text)
+        if vector is None:
+            vector = (await self.aembed_documents([text]))[0]
+            self._remember_query(text, vector)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "cached_queries": len(self._queries),
+            }
@@ -1,11 +1,17 @@
+import hashlib
 import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.vectorstores import InMemoryVectorStore
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain.tools.retriever import create_retriever_tool
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from pydantic import BaseModel, Field
-from typing import Literal
+from tools.bm25 import BM25Index
+from tools.vector_index import PersistentVectorIndex
 from utils.logger import get_logger
 from config import settings
 
@@ -20,115 +26,193 @@ class GradeDocuments(BaseModel):
     )
 
 
+class CaseRetriever(BaseRetriever):
+    """基于持久化向量索引的检索器，供 create_retriever_tool 使用"""
+
+    rag: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.rag.retrieve(query, self.k)
+
+
 class RAGTool:
+    """历史案例检索工具
+
+    构造时不做任何初始化；首次使用（或调用 start_warmup）时在后台线程中打开索引并同步报告。
+    初始化完成前的查询直接返回“未初始化”，不阻塞调用方。
+    评估过程中生成的新报告通过 ingest_report 逐条加入案例库。
+    查询先经本地 BM25 倒排索引得到候选，只对候选做向量重排；词法分数足够拉开差距时不再请求嵌入。
+    """
+
     def __init__(self):
-        """初始化 RAG 工具"""
-        self.response_model = self._get_llm()
-        self.grader_model = self._get_llm()
-        self.vectorstore = None
+        """初始化 RAG 工具（仅创建状态，模型与索引延迟加载）"""
+        self.index = None
+        self.bm25 = None
         self.retriever = None
         self.retriever_tool = None
-        self._initialize_rag()
+        self._ready = threading.Event()
+        self._warmup_lock = threading.Lock()
+        self._warmup_thread = None
+        self._splitter = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # 检索时排除的报告（路径 -> 排除时的 mtime），以及它们对应的行号（首次检索时计算）
+        self._excluded_files: Dict[str, float] = {}
+        self._excluded_rows: Optional[Set[int]] = None
+        self._exclude_lock = threading.Lock()
 
+    @property
+    def response_model(self):
+        return self._get_llm()
 
-    def _get_llm(self):
-        """获取语言模型，使用与 config 相同的配置方式"""
-        if settings.USE_AZURE:
-            return AzureChatOpenAI(
-                api_key=settings.AZURE_API_KEY,
-                azure_endpoint=settings.AZURE_BASE_URL,
-                azure_deployment="gpt-4o",
-                api_version=settings.AZURE_API_VERSION,
-                temperature=0,
-            )
-        else:
-            return ChatOpenAI(
-                api_key=settings.OPENKEY_API_KEY,
-                base_url=settings.OPENKEY_BASE_URL,
-                model="gpt-4-turbo",
-                temperature=0,
-            )
+    @property
+    def grader_model(self):
+        return self._get_llm()
 
-    def _get_embeddings(self):
-        """获取嵌入模型，使用与 config 相同的配置方式"""
-        if settings.USE_AZURE:
-            return AzureOpenAIEmbeddings(
-                api_key=settings.AZURE_API_KEY,
-                azure_endpoint=settings.AZURE_BASE_URL,
-                azure_deployment="text-embedding-ada-002",
-                api_version=settings.AZURE_API_VERSION,
-            )
-        else:
-            return OpenAIEmbeddings(
-                api_key=settings.OPENKEY_API_KEY,
-                base_url=settings.OPENKEY_BASE_URL,
-                model="text-embedding-ada-002",
-            )
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
 
-    def _initialize_rag(self):
-        """初始化 RAG 系统"""
-        try:
-            reports_dir = "reports"
-            if not os.path.exists(reports_dir):
-                self.vectorstore = InMemoryVectorStore.from_documents(
-                    [], embedding=self._get_embeddings()
+    def start_warmup(self) -> threading.Thread:
+        """在后台线程中初始化 RAG 系统（重复调用只启动一次）"""
+        with self._warmup_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(
+                    target=self._warmup, name="rag-warmup", daemon=True
                 )
-                self.retriever = self.vectorstore.as_retriever()
-                return
+                self._warmup_thread.start()
+            return self._warmup_thread
 
-            report_files = []
-            for filename in os.listdir(reports_dir):
-                if filename.endswith(".txt"):
-                    filepath = os.path.join(reports_dir, filename)
-                    report_files.append(filepath)
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """启动（如尚未启动）并等待初始化完成，返回是否已就绪"""
+        self.start_warmup()
+        return self._ready.wait(timeout)
 
-            if not report_files:
-                logger.warning("reports 目录中没有找到历史报告文件")
-                self.vectorstore = InMemoryVectorStore.from_documents(
-                    [], embedding=self._get_embeddings()
-                )
-                self.retriever = self.vectorstore.as_retriever()
-                return
-
-            from langchain_core.documents import Document
-
-            docs_list = []
-
-            for filepath in report_files:
-                try:
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        content = f.read()
-
-                    doc = Document(
-                        page_content=content,
-                        metadata={
-                            "source": filepath,
-                            "filename": os.path.basename(filepath),
-                        },
-                    )
-                    docs_list.append(doc)
-                    logger.debug(f"加载历史报告: {os.path.basename(filepath)}")
-                except Exception as e:
-                    logger.error(f"读取报告文件失败 {filepath}: {e}")
-
-            if not docs_list:
-                logger.warning("没有成功加载任何历史报告")
-                self.vectorstore = InMemoryVectorStore.from_documents(
-                    [], embedding=self._get_embeddings()
-                )
-                self.retriever = self.vectorstore.as_retriever()
-                return
+    def _warmup(self):
+        try:
+            self._initialize_rag()
+        finally:
+            # 写入初始化期间提交的新报告，队列清空后才标记就绪
+            while True:
+                with self._pending_lock:
+                    pending, self._pending = self._pending, []
+                    if not pending:
+                        self._ready.set()
+                        break
+                for filepath in pending:
+                    self._ingest_file(filepath)
+
+    def exclude_sources(self, directory: str) -> None:
+        """检索时排除 directory 下此刻已存在的报告
+
+        案例库会跨运行保留已写入的报告，重跑同一数据集时条目可能检索到自己之前的结论。
+        这里只记录调用时已有的报告及其 mtime：本次运行重写或新写入的报告 mtime 不同，
+        加入案例库后仍可被其他条目检索到。
+        """
+        snapshot = {}
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.endswith(".txt"):
+                    snapshot[os.path.abspath(entry.path)] = entry.stat().st_mtime
+        with self._exclude_lock:
+            self._excluded_files.update(snapshot)
+            self._excluded_rows = None
+
+    def _get_excluded_rows(self) -> Set[int]:
+        with self._exclude_lock:
+            if self._excluded_rows is None:
+                excluded = set()
+                if self._excluded_files:
+                    # 索引中的 mtime 与排除时一致，说明仍是运行前的旧报告
+                    stale = {
+                        source for source, (_, mtime, _) in self.index.file_states().items()
+                        if self._excluded_files.get(os.path.abspath(source)) == mtime
+                    }
+                    excluded = {row for row, source in self.index.live_sources() if source in stale}
+                self._excluded_rows = excluded
+            return self._excluded_rows
+
+    def ingest_report(self, filepath: str) -> int:
+        """将新生成的报告加入案例库（同时写入持久化索引），返回新增的文档块数
+
+        代价只与该报告的长度有关，可由多个评估线程并发调用；
+        RAG 尚未初始化完成时报告先进入队列，初始化结束后统一写入。
+        """
+        with self._pending_lock:
+            if not self._ready.is_set():
+                self._pending.append(filepath)
+                self.start_warmup()
+                return 0
+        return self._ingest_file(filepath)
 
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    def _ingest_file(self, filepath: str) -> int:
+        if self.index is None:
+            return 0
+        try:
+            stat = os.stat(filepath)
+            with open(filepath, "r", encoding="utf-8") as f:
+                content = f.read()
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            state = self.index.file_state(filepath)
+            if state and state[0] == digest:
+                # 内容未变只更新 mtime：本次运行重写的报告不再按运行前的旧报告排除
+                self.index.touch_file(filepath, stat.st_mtime, stat.st_size)
+                with self._exclude_lock:
+                    self._excluded_rows = None
+                return 0
+
+            chunks = self._get_splitter().split_text(content)
+            vectors = self._get_embeddings().embed_documents(chunks) if chunks else []
+            added, replaced = self.index.add_file(
+                filepath, digest, stat.st_mtime, stat.st_size, chunks, vectors
+            )
+            if self.bm25 is not None:
+                for row in replaced:
+                    self.bm25.remove(row)
+                self.bm25.add_many(zip(added, chunks))
+            logger.debug(f"新报告已加入案例库: {os.path.basename(filepath)} ({len(chunks)} 块)")
+            return len(chunks)
+        except Exception as e:
+            logger.error(f"新报告加入案例库失败 {filepath}: {e}")
+            return 0
+
+    def _get_splitter(self):
+        if self._splitter is None:
+            self._splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
                 chunk_size=200, chunk_overlap=50
             )
-            doc_splits = text_splitter.split_documents(docs_list)
+        return self._splitter
+
+    def _get_llm(self):
+        """获取语言模型（来自 settings 的共享客户端注册表）"""
+        model = "gpt-4o" if settings.USE_AZURE else "gpt-4-turbo"
+        return settings.create_chat_model(model, temperature=0)
 
-            self.vectorstore = InMemoryVectorStore.from_documents(
-                documents=doc_splits, embedding=self._get_embeddings()
+    def _get_embeddings(self):
+        """获取嵌入模型（来自 settings 的共享客户端注册表）"""
+        return settings.get_embeddings("text-embedding-ada-002")
+
+    def _initialize_rag(self):
+        """初始化 RAG 系统：打开持久化索引，只对新增或修改过的报告重新嵌入"""
+        start = time.monotonic()
+        try:
+            self.index = PersistentVectorIndex(
+                settings.RAG_INDEX_DIR,
+                dtype=settings.RAG_VECTOR_DTYPE,
+                search_mode=settings.RAG_SEARCH_MODE,
+                ann_min_rows=settings.RAG_IVF_MIN_ROWS,
+                nprobe=settings.RAG_IVF_NPROBE,
             )
-            self.retriever = self.vectorstore.as_retriever()
+            self._sync_reports(settings.RAG_REPORTS_DIR)
 
+            bm25 = BM25Index()
+            bm25.add_many(self.index.iter_live_chunks())
+            self.bm25 = bm25
+
+            self.retriever = CaseRetriever(rag=self)
             self.retriever_tool = create_retriever_tool(
                 self.retriever,
                 "retrieve_historical_cases",
@@ -136,21 +220,127 @@ class RAGTool:
             )
 
             logger.info(
-                f"RAG 系统初始化成功，加载了 {len(docs_list)} 个历史报告文件，分割为 {len(doc_splits)} 个文档块"
+                f"RAG 系统初始化成功，索引中共有 {len(self.index.file_states())} 个历史报告文件，"
+                f"{self.index.live_count} 个文档块，耗时 {time.monotonic() - start:.1f} 秒"
             )
         except Exception as e:
             logger.error(f"RAG 系统初始化失败: {e}")
-            self.vectorstore = None
+            self.index = None
+            self.bm25 = None
             self.retriever = None
             self.retriever_tool = None
 
+    def _sync_reports(self, reports_dir: str):
+        """将 reports 目录与索引同步：mtime/大小未变的文件直接跳过，内容哈希变化的文件重新嵌入"""
+        report_files = []
+        if os.path.exists(reports_dir):
+            for filename in os.listdir(reports_dir):
+                if filename.endswith(".txt"):
+                    report_files.append(os.path.join(reports_dir, filename))
+        if not report_files:
+            logger.warning("reports 目录中没有找到历史报告文件")
+
+        indexed = self.index.file_states()
+        pending = []
+
+        for filepath in report_files:
+            try:
+                stat = os.stat(filepath)
+                state = indexed.get(filepath)
+                if state and state[1] == stat.st_mtime and state[2] == stat.st_size:
+                    continue
+
+                with open(filepath, "r", encoding="utf-8") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                if state and state[0] == digest:
+                    self.index.touch_file(filepath, stat.st_mtime, stat.st_size)
+                    continue
+                pending.append((filepath, digest, stat, content))
+            except Exception as e:
+                logger.error(f"读取报告文件失败 {filepath}: {e}")
+
+        if pending:
+            text_splitter = self._get_splitter()
+            splits = [text_splitter.split_text(content) for _, _, _, content in pending]
+            # 所有变更报告的文本块合并为一次批量嵌入，重复的模板文本只请求一次
+            all_chunks = [chunk for chunks in splits for chunk in chunks]
+            vectors = self._get_embeddings().embed_documents(all_chunks) if all_chunks else []
+
+            offset = 0
+            for (filepath, digest, stat, _), chunks in zip(pending, splits):
+                file_vectors = vectors[offset:offset + len(chunks)]
+                offset += len(chunks)
+                self.index.add_file(filepath, digest, stat.st_mtime, stat.st_size, chunks, file_vectors)
+                logger.debug(f"索引历史报告: {os.path.basename(filepath)} ({len(chunks)} 块)")
+
+        # reports 目录外的来源是运行中通过 ingest_report 加入的，只在文件被删除时移除
+        report_set = set(report_files)
+        removed = {
+            source for source in indexed
+            if source not in report_set
+            and (os.path.dirname(source) == reports_dir or not os.path.exists(source))
+        }
+        for filepath in removed:
+            self.index.remove_file(filepath)
+        if removed:
+            self.index.maybe_compact()
+
+        logger.info(f"历史报告索引同步完成: 新增/更新 {len(pending)} 个，删除 {len(removed)} 个")
+
+    def retrieve(self, query: str, k: int = 4) -> List[Document]:
+        """检索与查询最相似的 k 个文档块"""
+        if not self.wait_ready(settings.RAG_WARMUP_WAIT):
+            return []
+        if not self.index or not self.index.live_count:
+            return []
+        excluded = self._get_excluded_rows()
+        candidates = self.bm25.search(query, settings.RAG_BM25_CANDIDATES) if self.bm25 else []
+        candidates = [(row, score) for row, score in candidates if row not in excluded]
+        if self._lexically_decisive(candidates, k):
+            # 前 k 个词法候选与其余候选差距明显，无需请求查询向量
+            hits, method = candidates[:k], "bm25"
+        else:
+            query_vector = self._get_embeddings().embed_query(query)
+            if len(candidates) > k:
+                hits = self.index.score_rows(query_vector, [row for row, _ in candidates])[:k]
+                method = "bm25+vector"
+            else:
+                # 词法候选不足时退回全量向量检索
+                hits, method = self.index.search(query_vector, k, exclude=excluded), "vector"
+        chunks = self.index.chunks([row for row, _ in hits])
+        docs = []
+        for row, score in hits:
+            if row not in chunks:
+                continue
+            source, text = chunks[row]
+            docs.append(Document(
+                page_content=text,
+                metadata={
+                    "source": source,
+                    "filename": os.path.basename(source),
+                    "score": score,
+                    "retrieval": method,
+                },
+            ))
+        return docs
+
+    def _lexically_decisive(self, candidates, k: int) -> bool:
+        """第 k 名的 BM25 分数是否明显高于第 k+1 名"""
+        if len(candidates) <= k:
+            return False
+        return candidates[k - 1][1] >= settings.RAG_BM25_DECISIVE_RATIO * candidates[k][1]
+
     def search_historical_cases(self, query: str, max_results: int = 5) -> str:
         """搜索历史案例"""
+        if not self.wait_ready(settings.RAG_WARMUP_WAIT):
+            logger.info("RAG 系统仍在后台初始化，本次跳过历史案例搜索")
+            return "RAG 系统未初始化，无法搜索历史案例"
         if not self.retriever:
             return "RAG 系统未初始化，无法搜索历史案例"
 
         try:
-            docs = self.retriever.get_relevant_documents(query, k=max_results)
+            docs = self.retrieve(query, k=max_results)
 
             if not docs:
                 return "未找到相关的历史案例"
@@ -0,0 +1,484 @@
+# tools/vector_index.py
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from tools.vector_search import IVFIndex, exact_top_k
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    source TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    mtime  REAL NOT NULL,
+    size   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    row      INTEGER PRIMARY KEY,
+    source   TEXT    NOT NULL,
+    chunk_no INTEGER NOT NULL,
+    text     TEXT    NOT NULL,
+    deleted  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source);
+"""
+
+
+class PersistentVectorIndex:
+    """磁盘持久化的向量索引
+
+    目录结构：
+      meta.db      SQLite 元数据表：报告文件的哈希/mtime，以及每个文本块所在的行号与内容
+      vectors.bin  按行追加的归一化向量（默认 float16），通过 np.memmap 只读映射
+      ivf.npz      可选的 IVF 近似索引（质心与每行所属的簇）
+
+    报告更新或删除时旧行只做删除标记，删除比例过高时再整体压缩。
+    在锁外使用向量矩阵的读者（检索、重排、IVF 训练）通过 _acquire_matrix / _release_matrix 登记，
+    压缩或截断向量文件前等待读者结束并释放内存映射（Windows 上被映射的文件不能替换或截断）。
+    向量先于元数据写入：向量文件比已提交行数长（追加中途退出）时截掉多出的部分；
+    比已提交行数短（文件损坏或被删除）时索引会被重置，由调用方重新嵌入。
+    """
+
+    def __init__(self, index_dir: str, dtype: str = "float16", search_mode: str = "auto",
+                 ann_min_rows: int = 50000, nprobe: int = 16):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.db_path = os.path.join(index_dir, "meta.db")
+        self.vectors_path = os.path.join(index_dir, "vectors.bin")
+        self.ivf_path = os.path.join(index_dir, "ivf.npz")
+        self.dtype = np.dtype(dtype)
+        self.search_mode = search_mode
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self._ivf = None
+        # 重置或压缩时递增，后台训练完成时据此丢弃行号已失效的结果
+        self._ivf_epoch = 0
+        self._ivf_thread = None
+        self._ivf_failed_epoch = None
+
+        self._lock = threading.RLock()
+        self._readers = 0
+        self._remapping = False  # 等待释放内存映射期间，新的读者先等待
+        self._no_readers = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+        self.dim = int(self._get_meta("dim") or 0)
+        self.rows = int(self._get_meta("rows") or 0)
+        stored_dtype = self._get_meta("dtype")
+        if stored_dtype and stored_dtype != self.dtype.name:
+            logger.warning("向量索引精度由 %s 变为 %s，重建索引", stored_dtype, self.dtype.name)
+            self.reset()
+        elif not self._repair_vector_file():
+            logger.warning("向量文件短于元数据记录的行数，重建索引: %s", index_dir)
+            self.reset()
+
+        self._matrix = None
+        self._load_deleted()
+
+    # ---------- 元数据 ----------
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    def _repair_vector_file(self) -> bool:
+        """使向量文件与已提交的行数一致，无法修复（文件偏短）时返回 False"""
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        expected = self.rows * self.dim * self.dtype.itemsize
+        if size > expected:
+            # 上次追加向量后、提交元数据前退出，多出的部分没有对应的文本块
+            logger.warning("向量文件有 %d 字节未提交的尾部数据，截断到 %d 行", size - expected, self.rows)
+            os.truncate(self.vectors_path, expected)
+        return size >= expected
+
+    def _load_deleted(self) -> None:
+        self._deleted_buf = np.zeros(max(self.rows, 1024), dtype=bool)
+        for (row,) in self._conn.execute("SELECT row FROM chunks WHERE deleted = 1"):
+            if row < self.rows:
+                self._deleted_buf[row] = True
+        self._n_deleted = int(self._deleted_buf.sum())
+
+    def _grow_deleted(self, rows: int) -> None:
+        """删除标记数组按容量翻倍扩展，追加行的摊还代价为 O(1)"""
+        if rows > len(self._deleted_buf):
+            buf = np.zeros(max(rows, 2 * len(self._deleted_buf)), dtype=bool)
+            buf[:len(self._deleted_buf)] = self._deleted_buf
+            self._deleted_buf = buf
+
+    def _mark_deleted(self, source: str) -> List[int]:
+        """在当前事务中标记 source 的现有行为已删除，返回这些行号"""
+        rows = [row for (row,) in self._conn.execute(
+            "SELECT row FROM chunks WHERE source = ? AND deleted = 0", (source,)
+        )]
+        if rows:
+            self._conn.execute(
+                "UPDATE chunks SET deleted = 1 WHERE source = ? AND deleted = 0", (source,)
+            )
+        return rows
+
+    def _apply_deleted(self, rows: List[int]) -> None:
+        if rows:
+            self._deleted_buf[rows] = True
+            self._n_deleted += len(rows)
+
+    @property
+    def _deleted(self) -> np.ndarray:
+        return self._deleted_buf[:self.rows]
+
+    def reset(self) -> None:
+        """清空索引"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.execute("DELETE FROM files")
+                self._conn.execute("DELETE FROM meta")
+                self._set_meta("dtype", self.dtype.name)
+            self._release_mapping()
+            if os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+            self._drop_ivf()
+            self.dim = 0
+            self.rows = 0
+            self._deleted_buf = np.zeros(1024, dtype=bool)
+            self._n_deleted = 0
+
+    def file_states(self) -> Dict[str, Tuple[str, float, int]]:
+        """已索引的报告文件: source -> (sha256, mtime, size)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT source, sha256, mtime, size FROM files").fetchall()
+        return {source: (sha, mtime, size) for source, sha, mtime, size in rows}
+
+    def file_state(self, source: str) -> Optional[Tuple[str, float, int]]:
+        """单个报告文件的 (sha256, mtime, size)，未索引时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, mtime, size FROM files WHERE source = ?", (source,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def touch_file(self, source: str, mtime: float, size: int) -> None:
+        """内容未变化时只更新 mtime，避免下次启动重新计算哈希"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET mtime = ?, size = ? WHERE source = ?", (mtime, size, source)
+            )
+
+    @property
+    def live_count(self) -> int:
+        return self.rows - self._n_deleted
+
+    # ---------- 写入 ----------
+    def add_file(self, source: str, sha256: str, mtime: float, size: int,
+                 chunks: List[str], vectors: np.ndarray) -> Tuple[List[int], List[int]]:
+        """写入（或替换）一个报告文件的全部文本块与向量，返回 (新增行号, 被替换的旧行号)
+
+        代价只与该文件的文本块数有关，与索引中已有的行数无关，可在评估过程中逐条调用。
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1 and not len(vectors):
+            vectors = vectors.reshape(0, self.dim)
+        if len(chunks) != len(vectors):
+            raise ValueError("文本块数量与向量数量不一致")
+        with self._lock:
+            if len(vectors) and not self.dim:
+                self.dim = vectors.shape[1]
+            if len(vectors) and vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {self.dim}")
+
+            # 归一化后点积即余弦相似度
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+
+            # 先追加向量，再提交元数据；中途崩溃时行数校验会发现不一致
+            start = self.rows
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            try:
+                with self._conn:
+                    replaced = self._mark_deleted(source)
+                    self._conn.executemany(
+                        "INSERT INTO chunks (row, source, chunk_no, text) VALUES (?, ?, ?, ?)",
+                        [(start + i, source, i, text) for i, text in enumerate(chunks)],
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO files (source, sha256, mtime, size) VALUES (?, ?, ?, ?)",
+                        (source, sha256, mtime, size),
+                    )
+                    self._set_meta("dim", self.dim)
+                    self._set_meta("rows", start + len(chunks))
+                    self._set_meta("dtype", self.dtype.name)
+            except Exception:
+                # 元数据未提交，截掉刚追加的向量，保持文件与行数一致
+                self._release_mapping()
+                os.truncate(self.vectors_path, start * self.dim * self.dtype.itemsize)
+                raise
+
+            self._grow_deleted(start + len(chunks))
+            self.rows = start + len(chunks)
+            self._apply_deleted(replaced)
+            self._matrix = None
+            return list(range(start, start + len(chunks))), replaced
+
+    def remove_file(self, source: str) -> List[int]:
+        """删除一个报告文件的全部文本块（仅做删除标记），返回被删除的行号"""
+        with self._lock:
+            with self._conn:
+                removed = self._mark_deleted(source)
+                self._conn.execute("DELETE FROM files WHERE source = ?", (source,))
+            self._apply_deleted(removed)
+            return removed
+
+    def maybe_compact(self, max_deleted_ratio: float = 0.3) -> None:
+        """删除标记的行超过一定比例时，重写向量文件并重新编号"""
+        with self._lock:
+            n_deleted = self._n_deleted
+            if not self.rows or n_deleted / self.rows <= max_deleted_ratio:
+                return
+
+            live = np.flatnonzero(~self._deleted)
+            tmp_path = self.vectors_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(np.asarray(self.matrix()[live]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self._release_mapping()
+
+            try:
+                with self._conn:
+                    self._conn.execute("DELETE FROM chunks WHERE deleted = 1")
+                    self._conn.executemany(
+                        "UPDATE chunks SET row = ? WHERE row = ?",
+                        [(new, int(old)) for new, old in enumerate(live) if new != old],
+                    )
+                    self._set_meta("rows", len(live))
+                    # 在元数据提交前替换向量文件：替换失败时事务回滚，索引保持原状；
+                    # 替换后、提交前退出时向量文件短于记录的行数，下次打开会重建索引
+                    os.replace(tmp_path, self.vectors_path)
+            except OSError as e:
+                os.remove(tmp_path)
+                logger.warning("向量文件替换失败，本次跳过压缩: %s", e)
+                return
+            # 行号已重排，IVF 的簇分配随之失效
+            self._drop_ivf()
+
+            self.rows = len(live)
+            self._load_deleted()
+            logger.info("向量索引已压缩: 移除 %d 行，剩余 %d 行", n_deleted, self.rows)
+
+    # ---------- 读取 ----------
+    def matrix(self) -> np.ndarray:
+        """返回 (rows, dim) 的只读向量矩阵（内存映射）"""
+        with self._lock:
+            if self._matrix is None:
+                if not self.rows:
+                    self._matrix = np.zeros((0, self.dim), dtype=self.dtype)
+                else:
+                    self._matrix = np.memmap(
+                        self.vectors_path, dtype=self.dtype, mode="r",
+                        shape=(self.rows, self.dim),
+                    )
+            return self._matrix
+
+    def _acquire_matrix(self) -> np.ndarray:
+        """登记一个在锁外使用矩阵的读者并返回矩阵（需持有 self._lock），用完后调用 _release_matrix"""
+        while self._remapping:
+            self._no_readers.wait()
+        self._readers += 1
+        return self.matrix()
+
+    def _release_matrix(self) -> None:
+        with self._lock:
+            self._readers -= 1
+            if not self._readers:
+                self._no_readers.notify_all()
+
+    def _release_mapping(self) -> None:
+        """等待所有读者结束并释放向量文件的内存映射（需持有 self._lock）
+
+        读者结束后不再有对旧映射的引用，丢弃 _matrix 即关闭映射，之后才能替换、截断或删除向量文件。
+        """
+        self._remapping = True
+        try:
+            while self._readers:
+                self._no_readers.wait()
+        finally:
+            self._remapping = False
+            self._no_readers.notify_all()
+        self._matrix = None
+
+    def _drop_ivf(self) -> None:
+        self._ivf = None
+        self._ivf_epoch += 1
+        if os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+
+    def _get_ivf(self, matrix: np.ndarray) -> Optional[IVFIndex]:
+        """按检索模式返回可用的 IVF 索引，已有索引只为新增行分配簇
+
+        需要（重新）训练时在后台线程中进行并返回 None，训练完成前由调用方退回精确检索；
+        训练耗时随行数增长（10 万行约 45 秒），不能放在持有索引锁的查询路径上。
+        """
+        if self.search_mode == "exact":
+            return None
+        if self.search_mode == "auto" and self.live_count < self.ann_min_rows:
+            return None
+        if not len(matrix):
+            return None
+
+        if self._ivf is None:
+            self._ivf = IVFIndex.load(self.ivf_path)
+            if self._ivf is not None and self._ivf.rows > self.rows:
+                self._ivf = None
+        if self._ivf is None or self.rows > 4 * self._ivf.rows:
+            # 尚未训练，或数据量增长数倍后簇数量已不合适：后台重新训练
+            self._start_ivf_training(matrix)
+            return None
+        if self._ivf.rows < self.rows:
+            # 只为新增行分配簇；不落盘，下次加载时会再补上这部分
+            self._ivf.add(matrix)
+        return self._ivf
+
+    def _start_ivf_training(self, matrix: np.ndarray) -> None:
+        """启动后台 IVF 训练（需持有 self._lock；已在训练或本轮训练失败过时不重复启动）"""
+        if self._ivf_thread is not None and self._ivf_thread.is_alive():
+            return
+        if self._ivf_failed_epoch == self._ivf_epoch:
+            return
+        # 训练线程在锁外读取 matrix，登记为读者，由 _train_ivf 结束时释放
+        self._readers += 1
+        self._ivf_thread = threading.Thread(
+            target=self._train_ivf, args=(matrix, self._ivf_epoch), name="ivf-train", daemon=True
+        )
+        self._ivf_thread.start()
+
+    def _train_ivf(self, matrix: np.ndarray, epoch: int) -> None:
+        """在 matrix 快照上训练 IVF（不持锁），完成后补齐训练期间新增的行并原子替换"""
+        start = time.monotonic()
+        try:
+            ivf = IVFIndex.train(matrix)
+        except Exception as e:
+            logger.error("IVF 索引训练失败，继续使用精确检索: %s", e)
+            with self._lock:
+                self._ivf_failed_epoch = epoch
+            return
+        finally:
+            n = len(matrix)
+            del matrix
+            self._release_matrix()
+        with self._lock:
+            if epoch != self._ivf_epoch:
+                # 训练期间索引被重置或压缩，行号已变化
+                logger.info("IVF 训练期间索引已重排，丢弃本次训练结果")
+                return
+            ivf.add(self.matrix())
+            ivf.save(self.ivf_path)
+            self._ivf = ivf
+        logger.info(
+            "IVF 索引训练完成: %d 行，%d 个簇，耗时 %.1f 秒",
+            n, ivf.nlist, time.monotonic() - start,
+        )
+
+    def search(self, query_vector, k: int = 5,
+               exclude: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """余弦相似度检索，返回 [(row, score)]，按分数降序
+
+        行数较少时做精确检索；超过 ann_min_rows（或 search_mode="ivf"）时使用 IVF 近似检索，
+        IVF 在后台训练完成前同样做精确检索。
+        exclude 中的行与已删除的行一样不参与检索。
+        """
+        with self._lock:
+            matrix = self._acquire_matrix()
+            deleted = self._deleted
+            available = self.live_count
+            if exclude:
+                deleted = deleted.copy()
+                deleted[[row for row in exclude if row < len(deleted)]] = True
+                available = int((~deleted).sum())
+            ivf = self._get_ivf(matrix)
+            # 其他线程写入时 _get_ivf 可能继续追加簇分配，这里固定与 matrix 同一时刻的状态
+            ivf_snapshot = ivf.snapshot() if ivf is not None else None
+        try:
+            if not len(matrix) or k <= 0:
+                return []
+
+            rows = None
+            if ivf is not None:
+                rows, scores = ivf.search(matrix, query_vector, k, nprobe=self.nprobe,
+                                          deleted=deleted, snapshot=ivf_snapshot)
+                if len(rows) < min(k, available):
+                    rows = None  # 探测的簇内候选不足，退回精确检索
+            if rows is None:
+                rows, scores = exact_top_k(matrix, query_vector, k, deleted=deleted)
+            return [(int(row), float(score)) for row, score in zip(rows, scores)]
+        finally:
+            del matrix
+            self._release_matrix()
+
+    def score_rows(self, query_vector, rows: List[int]) -> List[Tuple[int, float]]:
+        """只对给定行计算余弦相似度（用于候选重排），返回 [(row, score)]，按分数降序"""
+        with self._lock:
+            matrix = self._acquire_matrix()
+            deleted = self._deleted
+        try:
+            rows = np.asarray(sorted(r for r in rows if r < len(matrix) and not deleted[r]), dtype=np.int64)
+            if not len(rows):
+                return []
+            q = np.asarray(query_vector, dtype=np.float32)
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ q
+        finally:
+            del matrix
+            self._release_matrix()
+        order = np.argsort(-scores, kind="stable")
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def live_sources(self) -> List[Tuple[int, str]]:
+        """所有未删除的文本块: [(row, source)]"""
+        with self._lock:
+            return self._conn.execute("SELECT row, source FROM chunks WHERE deleted = 0").fetchall()
+
+    def iter_live_chunks(self, batch_size: int = 10000):
+        """按行号顺序遍历未删除的文本块: (row, text)"""
+        last = -1
+        while True:
+            with self._lock:
+                batch = self._conn.execute(
+                    "SELECT row, text FROM chunks WHERE deleted = 0 AND row > ? "
+                    "ORDER BY row LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not batch:
+                return
+            yield from batch
+            last = batch[-1][0]
+
+    def chunks(self, rows: List[int]) -> Dict[int, Tuple[str, str]]:
+        """按行号取文本块: row -> (source, text)"""
+        if not rows:
+            return {}
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            result = self._conn.execute(
+                f"SELECT row, source, text FROM chunks WHERE row IN ({placeholders})",
+                [int(r) for r in rows],
+            ).fetchall()
+        return {row: (source, text) for row, source, text in result}
@@ -0,0 +1,261 @@
+# tools/vector_search.py
+import argparse
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _normalize(query) -> np.ndarray:
+    q = np.asarray(query, dtype=np.float32)
+    return q / max(float(np.linalg.norm(q)), 1e-12)
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """从候选中取分数最高的 k 个，按分数降序"""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+
+def exact_top_k(matrix: np.ndarray, query, k: int, deleted: Optional[np.ndarray] = None,
+                block_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """精确余弦检索（向量已归一化）：分块矩阵乘 + argpartition
+
+    每块转换为 float32 后与查询向量相乘，只保留块内前 k 个候选，
+    内存占用与块大小相关而与总行数无关，可直接作用于 float16 的内存映射矩阵。
+    返回 (行号, 分数)，按分数降序。
+    """
+    n = len(matrix)
+    if not n or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    q = _normalize(query)
+
+    cand_rows, cand_scores = [], []
+    for start in range(0, n, block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        scores = block @ q
+        rows = np.arange(start, start + len(block))
+        if deleted is not None:
+            live = ~deleted[start:start + len(block)]
+            rows, scores = rows[live], scores[live]
+        if len(scores):
+            rows, scores = _top_k(rows, scores, k)
+            cand_rows.append(rows)
+            cand_scores.append(scores)
+
+    if not cand_rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return _top_k(np.concatenate(cand_rows), np.concatenate(cand_scores), k)
+
+
+class IVFIndex:
+    """倒排文件（IVF）近似索引
+
+    用球面 k-means 将向量划分为 nlist 个簇，查询时只精确计算距离最近的 nprobe 个簇内的向量。
+    新追加的行按最近质心直接归入已有簇，无需重新训练；倒排表在追加行累积到一定比例后才重建，
+    此前查询对这部分尾部行按簇号过滤后直接计算。
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids.astype(np.float32)
+        self._assign_buf = assignments.astype(np.int32)
+        self._n = len(assignments)
+        self._build_lists()
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def rows(self) -> int:
+        return self._n
+
+    @property
+    def assignments(self) -> np.ndarray:
+        return self._assign_buf[:self._n]
+
+    def _build_lists(self) -> None:
+        # 按簇号排序后的行号 + 每个簇的起止偏移 + 已建表的行数
+        # （整体替换，检索线程不会读到不一致的一半）
+        assignments = self.assignments
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self._lists = (order, offsets, len(assignments))
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray, start: int = 0,
+                block_rows: Optional[int] = None) -> np.ndarray:
+        # 每块的 (块行数 × 簇数) 得分矩阵控制在约 64MB 以内
+        block_rows = block_rows or max(1024, (1 << 24) // len(centroids))
+        out = np.empty(len(matrix) - start, dtype=np.int32)
+        for s in range(start, len(matrix), block_rows):
+            block = np.asarray(matrix[s:s + block_rows], dtype=np.float32)
+            out[s - start:s - start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, nlist: Optional[int] = None, iters: int = 10,
+              sample_per_list: int = 64, seed: int = 0) -> "IVFIndex":
+        """在（采样的）向量上训练质心，并为全部行分配簇"""
+        n = len(matrix)
+        if nlist is None:
+            nlist = int(np.clip(4 * np.sqrt(n), 16, 4096))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, nlist * sample_per_list)
+        sample_rows = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # 空簇重新随机取样本点
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        return cls(centroids, cls._assign(matrix, centroids))
+
+    def add(self, matrix: np.ndarray) -> None:
+        """为训练之后追加的行分配簇"""
+        if len(matrix) <= self.rows:
+            return
+        new = self._assign(matrix, self.centroids, start=self.rows)
+        n = self._n + len(new)
+        if n > len(self._assign_buf):
+            # 容量翻倍扩展，追加的摊还代价为 O(1)
+            buf = np.empty(max(n, 2 * len(self._assign_buf)), dtype=np.int32)
+            buf[:self._n] = self.assignments
+            self._assign_buf = buf
+        self._assign_buf[self._n:n] = new
+        self._n = n
+        built = self._lists[2]
+        if self.rows - built > max(1024, built // 10):
+            self._build_lists()
+
+    def snapshot(self) -> tuple:
+        """当前簇分配与倒排表的快照
+
+        之后的 add 只会追加行或整体替换倒排表，快照保持不变；
+        检索线程应在与取 matrix / deleted 相同的锁内获取快照，保证三者行数一致。
+        """
+        return self.assignments, self._lists
+
+    def search(self, matrix: np.ndarray, query, k: int, nprobe: int = 16,
+               deleted: Optional[np.ndarray] = None,
+               snapshot: Optional[tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+        q = _normalize(query)
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        assignments, (order, offsets, built) = snapshot or self.snapshot()
+        tail = np.arange(built, len(assignments))
+        tail = tail[np.isin(assignments[built:], probes)]
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes] + [tail])
+        # 未传快照时 add 可能已在其他线程中追加了行
+        rows = rows[rows < len(matrix)]
+        if deleted is not None:
+            rows = rows[~deleted[rows]]
+        if not len(rows) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.sort(rows)  # 按行号顺序读取内存映射，减少随机 I/O
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ q
+        return _top_k(rows, scores, k)
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["centroids"], data["assignments"])
+
+
+def _random_matrix(n: int, dim: int, dtype: str, seed: int = 0,
+                   path: Optional[str] = None, noise: float = 0.5) -> np.ndarray:
+    """生成带簇结构的归一化随机向量，近似真实嵌入的分布；给定 path 时写入内存映射文件
+
+    noise 越大簇结构越弱，IVF 的召回率越低（0.5 为明显成簇，2.0 接近均匀分布）。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    if path:
+        out = np.memmap(path, dtype=dtype, mode="w+", shape=(n, dim))
+    else:
+        out = np.empty((n, dim), dtype=dtype)
+    for s in range(0, n, 65536):
+        m = min(65536, n - s)
+        block = centers[rng.integers(0, 256, m)] + noise * rng.standard_normal((m, dim)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[s:s + m] = block
+    return out
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), dim: int = 1536, k: int = 5,
+              queries: int = 20, nprobes=(16,), dtype: str = "float16",
+              workdir: Optional[str] = None, noise: float = 0.5) -> None:
+    """在不同规模下比较精确检索与 IVF 检索的单次查询延迟与召回率
+
+    给定 workdir 时向量写入其中的内存映射文件（与 PersistentVectorIndex 的读取方式一致），
+    大规模测试不必把整个矩阵放进内存。
+    """
+    print(f"{'chunks':>10} | {'exact ms':>9} | {'nprobe':>6} | {'ivf ms':>8} | {'recall@k':>8} | {'train s':>7}")
+    for n in sizes:
+        path = os.path.join(workdir, f"bench_{n}_{dim}.bin") if workdir else None
+        matrix = _random_matrix(n, dim, dtype, path=path, noise=noise)
+        rng = np.random.default_rng(1)
+        qs = np.asarray(matrix[rng.choice(n, queries, replace=False)], dtype=np.float32)
+        qs += 0.1 * rng.standard_normal(qs.shape).astype(np.float32)
+
+        start = time.perf_counter()
+        exact = [exact_top_k(matrix, q, k)[0] for q in qs]
+        exact_ms = (time.perf_counter() - start) * 1000 / queries
+
+        start = time.perf_counter()
+        ivf = IVFIndex.train(matrix)
+        train_s = time.perf_counter() - start
+
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            approx = [ivf.search(matrix, q, k, nprobe=nprobe)[0] for q in qs]
+            ivf_ms = (time.perf_counter() - start) * 1000 / queries
+
+            recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)])
+            print(f"{n:>10} | {exact_ms:>9.1f} | {nprobe:>6} | {ivf_ms:>8.1f} | {recall:>8.3f} | {train_s:>7.1f}",
+                  flush=True)
+
+        del matrix
+        if path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量检索基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[16])
+    parser.add_argument("--dtype", default="float16")
+    parser.add_argument("--workdir", help="向量写入该目录下的内存映射文件")
+    parser.add_argument("--noise", type=float, default=0.5, help="合成数据的簇内噪声")
+    args = parser.parse_args()
+    benchmark(args.sizes, args.dim, args.k, args.queries, args.nprobe, args.dtype,
+              args.workdir, args.noise)
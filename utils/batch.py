@@ -0,0 +1,134 @@
+# utils/batch.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def run_batch(
+    items: Iterable[Tuple[int, Any]],
+    worker: Callable[[int, Any], Any],
+    concurrency: int = 4,
+    window: int = None,
+) -> Iterator[Tuple[int, Any, Any]]:
+    """并发执行 worker，并按输入顺序逐条产出 (idx, item, result)。
+
+    - 同时最多有 concurrency 条数据在工作流中运行；
+    - 已完成但尚未轮到输出的结果会暂存在重排缓冲区中，
+      已提交未产出的总数不超过 window（默认 concurrency * 4），避免慢样本导致内存膨胀；
+    - 某条数据执行失败时，异常会在轮到该条输出时抛出，其之前的结果均已产出，
+      因此调用方按顺序落盘即可保持原有的断点续跑语义。
+    """
+    concurrency = max(1, int(concurrency or 1))
+    window = max(concurrency, int(window or concurrency * 4))
+
+    source = iter(items)
+    pending: Dict[Any, int] = {}  # future -> 序号
+    finished: Dict[int, Any] = {}  # 序号 -> future
+    order: Dict[int, Tuple[int, Any]] = {}  # 序号 -> (idx, item)
+    next_seq = 0  # 下一条待提交的序号
+    emit_seq = 0  # 下一条待产出的序号
+    exhausted = False
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        while True:
+            # 在并发与窗口限制内尽量多地提交任务
+            while (
+                not exhausted
+                and len(pending) < concurrency
+                and next_seq - emit_seq < window
+            ):
+                try:
+                    idx, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(worker, idx, item)
+                pending[future] = next_seq
+                order[next_seq] = (idx, item)
+                next_seq += 1
+
+            # 按顺序产出已完成的结果
+            while emit_seq in finished:
+                future = finished.pop(emit_seq)
+                idx, item = order.pop(emit_seq)
+                emit_seq += 1
+                # 若该条执行失败，result() 会重新抛出异常
+                yield idx, item, future.result()
+
+            if not pending:
+                if exhausted:
+                    break
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[pending.pop(future)] = future
+    finally:
+        if pending:
+            logger.warning("批量评估提前结束，取消 %d 个未完成任务", len(pending))
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def arun_batch(
+    items: Iterable[Tuple[int, Any]],
+    worker: Callable[[int, Any], Awaitable[Any]],
+    concurrency: int = 4,
+    window: int = None,
+) -> AsyncIterator[Tuple[int, Any, Any]]:
+    """run_batch 的异步版本：worker 为协程函数，所有任务运行在当前事件循环中。
+
+    并发、重排窗口与异常语义与 run_batch 相同。
+    """
+    concurrency = max(1, int(concurrency or 1))
+    window = max(concurrency, int(window or concurrency * 4))
+
+    source = iter(items)
+    pending: Dict[asyncio.Task, int] = {}
+    finished: Dict[int, asyncio.Task] = {}
+    order: Dict[int, Tuple[int, Any]] = {}
+    next_seq = 0
+    emit_seq = 0
+    exhausted = False
+
+    try:
+        while True:
+            while (
+                not exhausted
+                and len(pending) < concurrency
+                and next_seq - emit_seq < window
+            ):
+                try:
+                    idx, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(worker(idx, item))
+                pending[task] = next_seq
+                order[next_seq] = (idx, item)
+                next_seq += 1
+
+            while emit_seq in finished:
+                task = finished.pop(emit_seq)
+                idx, item = order.pop(emit_seq)
+                emit_seq += 1
+                yield idx, item, task.result()
+
+            if not pending:
+                if exhausted:
+                    break
+                continue
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                finished[pending.pop(task)] = task
+    finally:
+        if pending:
+            logger.warning("批量评估提前结束，取消 %d 个未完成任务", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,142 @@
+# utils/image.py
+import asyncio
+import base64
+import io
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Tuple, Union
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 视觉模型按 512px 切块计费；低细节模式固定 85 tokens
+_LOW_DETAIL_TOKENS = 85
+_TILE_TOKENS = 170
+_TILE_SIZE = 512
+
+
+def estimate_vision_tokens(width: int, height: int, detail: str = "high") -> int:
+    """按 OpenAI 视觉计费规则估算一张图片的输入 token 数"""
+    if detail == "low":
+        return _LOW_DETAIL_TOKENS
+    # 先缩放到 2048x2048 以内，再把短边缩放到 768 以内
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / _TILE_SIZE) * math.ceil(height / _TILE_SIZE)
+    return _LOW_DETAIL_TOKENS + _TILE_TOKENS * tiles
+
+
+def normalize_image(
+    data: Union[bytes, str],
+    max_size: Tuple[int, int] = (256, 256),
+    quality: int = 85,
+) -> Dict[str, Any]:
+    """校验、缩放并重新编码图片，以低细节模式（detail=low）发送
+
+    max_size 不超过 512px（默认 MAX_IMAGE_SIZE 为 256px），低细节模式已能看到缩放后的全部像素，
+    因此不再按尺寸选择 detail 级别。
+    data 可以是原始字节或 base64 字符串。返回的 dict 中 data 为 JPEG 的 base64 编码，
+    其余字段为尺寸与 token 估算，便于记录节省量。
+    图片无法解码时抛出 ValueError；未安装 Pillow 时原样返回。
+    """
+    raw = base64.b64decode(data) if isinstance(data, str) else data
+
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("未安装 Pillow，跳过图片规范化")
+        return {
+            "data": base64.b64encode(raw).decode("utf-8"),
+            "mime": "image/jpeg",
+            "detail": "high",
+            "original_bytes": len(raw),
+            "bytes": len(raw),
+        }
+
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.load()
+            original_width, original_height = img.size
+
+            if img.mode in ("RGBA", "LA", "P"):
+                # 透明背景铺白后再转 RGB
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            img.thumbnail(max_size, Image.LANCZOS)
+            width, height = img.size
+
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+    except Exception as e:
+        raise ValueError(f"无法解码图片: {e}") from e
+
+    detail = "low"
+    encoded = out.getvalue()
+    original_tokens = estimate_vision_tokens(original_width, original_height, "high")
+    tokens = estimate_vision_tokens(width, height, detail)
+
+    return {
+        "data": base64.b64encode(encoded).decode("utf-8"),
+        "mime": "image/jpeg",
+        "detail": detail,
+        "original_size": (original_width, original_height),
+        "size": (width, height),
+        "original_bytes": len(raw),
+        "bytes": len(encoded),
+        "original_tokens": original_tokens,
+        "tokens": tokens,
+        "saved_tokens": original_tokens - tokens,
+    }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """图片处理线程池（首次使用时创建）
+
+    Pillow 解码、缩放与 JPEG 编码期间会释放 GIL，线程即可并行处理；
+    不使用进程池，避免子进程重新导入主模块并构建整个工作流与各类客户端。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from config import settings
+
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image"
+            )
+        return _pool
+
+
+def _normalize_call(data: Union[bytes, str]):
+    from config import settings
+
+    return partial(
+        normalize_image,
+        data,
+        max_size=tuple(settings.MAX_IMAGE_SIZE),
+        quality=settings.IMAGE_JPEG_QUALITY,
+    )
+
+
+def normalize_image_in_pool(data: Union[bytes, str]) -> Dict[str, Any]:
+    """在线程池中规范化图片（同步等待结果）"""
+    return _get_pool().submit(_normalize_call(data)).result()
+
+
+async def anormalize_image_in_pool(data: Union[bytes, str]) -> Dict[str, Any]:
+    """在线程池中规范化图片，等待期间不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), _normalize_call(data))
@@ -0,0 +1,160 @@
+# utils/llm_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key         TEXT    PRIMARY KEY,
+    value       TEXT    NOT NULL,
+    size        INTEGER NOT NULL,
+    last_access REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access);
+"""
+
+
+class SQLiteLLMCache(BaseCache):
+    """按内容寻址的 LLM 响应磁盘缓存
+
+    - 键为 (llm_string, prompt) 的 SHA-256，llm_string 由 langchain 生成，
+      已包含模型、部署名、温度等调用参数，prompt 为序列化后的消息；
+    - 超过 max_bytes 后按最近访问时间淘汰旧条目；
+    - 记录命中/未命中次数，便于统计重跑节省的调用。
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        self._total_bytes = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()[0]
+        logger.info("LLM 缓存已打开: %s (%.1f MB)", db_path, self._total_bytes / 1e6)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            generations = [loads(gen) for gen in _split(row[0])]
+        except Exception as e:
+            logger.warning("LLM 缓存条目反序列化失败，忽略: %s", e)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with conn:
+            conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        with self._lock:
+            self.hits += 1
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        value = _join([dumps(gen) for gen in return_val])
+        size = len(value.encode("utf-8"))
+        conn = self._conn()
+        with conn:
+            old = conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+        with self._lock:
+            self._total_bytes += size - (old[0] if old else 0)
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self) -> None:
+        """按最近访问时间淘汰，直到总大小降到上限的 90% 以下"""
+        target = int(self.max_bytes * 0.9)
+        conn = self._conn()
+        removed = 0
+        with conn:
+            rows = conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_access"
+            )
+            victims = []
+            total = self._total_bytes
+            for key, size in rows:
+                if total <= target:
+                    break
+                victims.append((key,))
+                total -= size
+                removed += size
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        with self._lock:
+            self._total_bytes -= removed
+        logger.debug("LLM 缓存淘汰 %d 条 (%.1f MB)", len(victims), removed / 1e6)
+
+    def clear(self, **kwargs: Any) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+        with self._lock:
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size_mb": round(self._total_bytes / 1e6, 2),
+            }
+
+
+# 多个 generation 序列化后用不会出现在 JSON 中的分隔符拼接
+_SEP = "\x1e"
+
+
+def _join(parts):
+    return _SEP.join(parts)
+
+
+def _split(value):
+    return value.split(_SEP)
@@ -1,6 +1,7 @@
 # utils/logger.py
 import logging
 import functools
+import inspect
 import time
 from typing import Callable, Any
 
@@ -11,6 +12,26 @@ def get_logger(name: str) -> logging.Logger:
 def log_execution(logger: logging.Logger = None):
     """记录函数执行的装饰器"""
     def decorator(func: Callable):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                _logger = logger or get_logger(func.__module__)
+
+                func_name = func.__name__
+                start_time = time.perf_counter()
+
+                _logger.debug("开始执行: %s", func_name)
+
+                try:
+                    result = await func(*args, **kwargs)
+                    duration = time.perf_counter() - start_time
+                    _logger.debug("完成执行: %s (耗时: %.4f秒)", func_name, duration)
+                    return result
+                except Exception as e:
+                    _logger.exception("执行失败: %s | 错误: %s", func_name, str(e))
+                    raise
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # 自动获取记录器
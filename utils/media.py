@@ -0,0 +1,15 @@
+# utils/media.py
+from schemas.media import MediaRef
+
+
+def get_sample_image(path: str = None):
+    """获取图片的引用（不读取文件内容，在多模态调用时才编码）"""
+    return MediaRef.from_path(path)
+
+def get_sample_audio(path: str = None):
+    """获取音频的引用（不读取文件内容，在多模态调用时才编码）"""
+    return MediaRef.from_path(path)
+
+def get_sample_video(path: str = None):
+    """获取视频的引用（不读取文件内容，在多模态调用时才编码）"""
+    return MediaRef.from_path(path)
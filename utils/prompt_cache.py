@@ -0,0 +1,63 @@
+# utils/prompt_cache.py
+from typing import Any, Dict, List
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from config import settings
+
+_BACKGROUND_NOTE = "(This background information is not part of the user input and is for reference only)"
+
+
+def case_context_message(state: Dict[str, Any]) -> HumanMessage:
+    """构建辩论与仲裁共用的稳定前缀（指令、用户输入、背景信息）
+
+    同一条目的所有辩论轮次与仲裁调用都以这条消息开头且内容逐字一致，
+    提供方的前缀缓存（如 OpenAI/Azure 对 1024 token 以上的相同前缀）即可命中。
+    这里不能放入轮次号、角色等随调用变化的内容。
+    """
+    background = (state.get("background") or "").strip()
+    background = f"{background}\n{_BACKGROUND_NOTE}" if background else "None."
+    return HumanMessage(content=settings.PROMPT_TEMPLATES["case_context"].format(
+        instruction=state["instruction"],
+        translated_text=state["translated_text"],
+        background=background,
+    ))
+
+
+def cacheable_prompt(state: Dict[str, Any], history: List[BaseMessage],
+                     suffix: str) -> List[BaseMessage]:
+    """稳定前缀 + 只追加的辩论历史 + 本次调用的指令后缀"""
+    return [case_context_message(state), *history, HumanMessage(content=suffix)]
+
+
+def response_usage(response: Any) -> Dict[str, int]:
+    """从模型响应中读取 token 用量，cached_tokens 为命中提供方前缀缓存的输入 token 数"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens") or 0
+    completion_tokens = usage.get("output_tokens") or 0
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached_tokens is None:
+        # 旧版 langchain-openai 只在 response_metadata 中给出原始用量
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = prompt_tokens or token_usage.get("prompt_tokens") or 0
+        completion_tokens = completion_tokens or token_usage.get("completion_tokens") or 0
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return {
+        "calls": 1,
+        "prompt_tokens": int(prompt_tokens),
+        "cached_tokens": int(cached_tokens or 0),
+        "completion_tokens": int(completion_tokens),
+    }
+
+
+def merge_usage(left: Dict[str, int], right: Dict[str, int]) -> Dict[str, int]:
+    """按键累加两份 token 用量（也用作 AgentState 的 reducer）"""
+    merged = dict(left or {})
+    for key, value in (right or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def cache_hit_rate(usage: Dict[str, int]) -> float:
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    return round(usage.get("cached_tokens", 0) / prompt_tokens, 3) if prompt_tokens else 0.0
@@ -0,0 +1,231 @@
+# utils/rate_limiter.py
+import asyncio
+import email.utils
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Azure 执行 RPM/TPM 配额的窗口长度（秒）
+QUOTA_WINDOW_SECONDS = 10
+
+
+class TokenBucket:
+    """令牌桶：容量 capacity，每秒补充 rate；余额可以为负（表示超额使用后需要等待补足）"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """距离可以取出 amount 个令牌还需等待的秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class DeploymentLimiter:
+    """单个部署的限流器：请求数 (RPM) 与估算 token 数 (TPM) 两个令牌桶
+
+    Azure 按 10 秒窗口执行配额，因此桶容量取一个窗口（每分钟配额的 1/6），避免瞬时突发触发 429。
+    每次请求按最近实际用量的滑动平均预估 token，返回后再按实际用量校正。
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: Optional[int] = None, initial_tokens: int = 1000):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        window = QUOTA_WINDOW_SECONDS / 60
+        self.requests = TokenBucket(max(1.0, rpm * window), rpm / 60)
+        self.tokens = TokenBucket(max(1.0, tpm * window), tpm / 60) if tpm else None
+        self.avg_tokens = float(initial_tokens)
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _try_reserve(self) -> float:
+        """尝试预留一次请求额度；成功返回 0，否则返回建议等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self.blocked_until - now)
+            delay = max(delay, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.wait_time(self.avg_tokens, now))
+            if delay > 0:
+                return delay
+            self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(self.avg_tokens)
+            self.total_requests += 1
+            return 0.0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """在发送请求前调用，阻塞直到额度可用"""
+        delay = self._try_reserve()
+        if delay == 0:
+            return True
+        if not blocking:
+            return False
+        with self._lock:
+            self.waiting += 1
+        try:
+            while delay > 0:
+                time.sleep(min(delay, 1.0))
+                delay = self._try_reserve()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return True
+
+    async def aacquire(self, blocking: bool = True) -> bool:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        delay = self._try_reserve()
+        if delay == 0:
+            return True
+        if not blocking:
+            return False
+        with self._lock:
+            self.waiting += 1
+        try:
+            while delay > 0:
+                await asyncio.sleep(min(delay, 1.0))
+                delay = self._try_reserve()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return True
+
+    def record_usage(self, total_tokens: int) -> None:
+        """请求完成后按实际 token 用量校正预估值"""
+        with self._lock:
+            if self.tokens is not None:
+                self.tokens.consume(total_tokens - self.avg_tokens)
+            self.avg_tokens = 0.8 * self.avg_tokens + 0.2 * total_tokens
+            self.total_tokens += total_tokens
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        """收到 429 时暂停该部署的所有新请求，直到 Retry-After 到期"""
+        retry_after = retry_after if retry_after is not None else 5.0
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.rate_limited += 1
+        logger.warning("部署 %s 触发限流 (429)，暂停 %.1f 秒", self.name, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self.waiting,
+                "requests": self.total_requests,
+                "tokens": self.total_tokens,
+                "rate_limited": self.rate_limited,
+                "avg_tokens": round(self.avg_tokens),
+                "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            }
+
+
+class RateLimitScheduler:
+    """进程级限流调度器，按部署名管理各自的 DeploymentLimiter"""
+
+    def __init__(self, limits: Dict[str, Dict[str, int]]):
+        self.limiters: Dict[str, DeploymentLimiter] = {
+            name: DeploymentLimiter(name, cfg["rpm"], cfg.get("tpm"))
+            for name, cfg in limits.items()
+        }
+
+    def get(self, deployment: str) -> Optional[DeploymentLimiter]:
+        return self.limiters.get(deployment)
+
+    def queue_depth(self) -> int:
+        return sum(limiter.waiting for limiter in self.limiters.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+    def http_event_hooks(self, deployment: str, is_async: bool = False) -> Dict[str, list]:
+        """为 httpx 客户端生成响应钩子：遇到 429 时按 Retry-After 暂停该部署"""
+        limiter = self.get(deployment)
+        if limiter is None:
+            return {}
+
+        def on_response(response):
+            if response.status_code == 429:
+                limiter.on_rate_limited(parse_retry_after(response.headers))
+
+        if is_async:
+            async def aon_response(response):
+                on_response(response)
+            return {"response": [aon_response]}
+        return {"response": [on_response]}
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """解析 retry-after-ms / retry-after（秒数或 HTTP 日期）响应头"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LangChainRateLimiter(BaseRateLimiter):
+    """将 DeploymentLimiter 适配为 langchain 聊天模型的 rate_limiter 参数
+
+    langchain 只在未命中缓存、真正发送请求前调用 acquire。
+    """
+
+    def __init__(self, limiter: DeploymentLimiter):
+        self.limiter = limiter
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.limiter.acquire(blocking=blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await self.limiter.aacquire(blocking=blocking)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """从模型响应中读取实际 token 用量并回写到限流器"""
+
+    run_inline = True
+
+    def __init__(self, limiter: DeploymentLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens")
+        if total:
+            self.limiter.record_usage(int(total))
@@ -0,0 +1,151 @@
+# utils/result_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    dataset       TEXT    NOT NULL,
+    item_id       TEXT    NOT NULL,
+    idx           INTEGER NOT NULL,
+    risk_decision TEXT,
+    payload       TEXT    NOT NULL,
+    created_at    REAL    NOT NULL,
+    PRIMARY KEY (dataset, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_results_order ON results (dataset, idx);
+CREATE INDEX IF NOT EXISTS idx_results_decision ON results (dataset, risk_decision);
+"""
+
+
+class ResultStore:
+    """评估结果存储（SQLite WAL 模式）
+
+    - 以 (dataset, item_id) 为主键，每条结果在独立事务中追加，写入代价与已有数据量无关；
+    - 进程崩溃最多丢失正在写入的那一条，不会破坏已有结果；
+    - 断点续跑按已完成的 item_id 集合判断，而不是按已处理条数。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # sqlite3 连接不能跨线程共享，每个线程使用各自的连接
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        logger.info("结果库已打开: %s", db_path)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, dataset: str, item_id: str, idx: int, item: Dict[str, Any]) -> None:
+        """追加（或覆盖）一条结果"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(dataset, item_id, idx, risk_decision, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    dataset,
+                    str(item_id),
+                    idx,
+                    item.get("risk_decision"),
+                    json.dumps(item, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+
+    def append_many(self, dataset: str, rows: Iterable[Tuple[str, int, Dict[str, Any]]]) -> int:
+        """在单个事务中批量写入 (item_id, idx, item)，已存在的条目保持不变，返回新写入条数"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO results "
+                "(dataset, item_id, idx, risk_decision, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (dataset, str(item_id), idx, item.get("risk_decision"),
+                     json.dumps(item, ensure_ascii=False), now)
+                    for item_id, idx, item in rows
+                ),
+            )
+        return cur.rowcount
+
+    def completed_ids(self, dataset: str) -> Set[str]:
+        """返回该数据集已完成的 item_id 集合"""
+        rows = self._conn().execute(
+            "SELECT item_id FROM results WHERE dataset = ?", (dataset,)
+        )
+        return {row[0] for row in rows}
+
+    def count(self, dataset: str, risk_decision: Optional[str] = None) -> int:
+        """统计结果条数，可按 risk_decision 过滤"""
+        if risk_decision is None:
+            row = self._conn().execute(
+                "SELECT COUNT(*) FROM results WHERE dataset = ?", (dataset,)
+            ).fetchone()
+        else:
+            row = self._conn().execute(
+                "SELECT COUNT(*) FROM results WHERE dataset = ? AND risk_decision = ?",
+                (dataset, risk_decision),
+            ).fetchone()
+        return row[0]
+
+    def iter_results(self, dataset: str, risk_decision: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """按输入顺序遍历结果，可按 risk_decision 过滤"""
+        if risk_decision is None:
+            rows = self._conn().execute(
+                "SELECT payload FROM results WHERE dataset = ? ORDER BY idx", (dataset,)
+            )
+        else:
+            rows = self._conn().execute(
+                "SELECT payload FROM results WHERE dataset = ? AND risk_decision = ? ORDER BY idx",
+                (dataset, risk_decision),
+            )
+        for (payload,) in rows:
+            yield json.loads(payload)
+
+    def query(self, dataset: str, risk_decision: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按输入顺序返回结果列表，可按 risk_decision 过滤"""
+        return list(self.iter_results(dataset, risk_decision))
+
+    def export_json(self, dataset: str, path: str) -> int:
+        """将结果按输入顺序导出为 JSON 数组（先写临时文件再原子替换）"""
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        n = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for item in self.iter_results(dataset):
+                if n:
+                    f.write(",\n")
+                f.write(json.dumps(item, ensure_ascii=False, indent=4))
+                n += 1
+            f.write("\n]\n")
+        os.replace(tmp_path, path)
+        return n
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
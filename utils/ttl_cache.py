@@ -0,0 +1,164 @@
+# utils/ttl_cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ttl_cache (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,
+    expires_at  REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ttl_cache_access ON ttl_cache (last_access);
+CREATE INDEX IF NOT EXISTS idx_ttl_cache_expires ON ttl_cache (expires_at);
+"""
+
+
+class TTLCache:
+    """带过期时间的磁盘 KV 缓存（SQLite WAL，值为 JSON）
+
+    - 条目写入 ttl 秒后过期；
+    - 条目数超过 max_entries 后先清理过期条目，再按最近访问时间淘汰到上限的 90%；
+    - get_or_compute 对同一键的并发请求只执行一次计算，其余调用方等待并共享结果。
+    """
+
+    def __init__(self, db_path: str, ttl: float, max_entries: int = 50000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        with conn:
+            conn.execute("DELETE FROM ttl_cache WHERE expires_at <= ?", (time.time(),))
+        self._count = conn.execute("SELECT COUNT(*) FROM ttl_cache").fetchone()[0]
+        logger.info("TTL 缓存已打开: %s (%d 条)", db_path, self._count)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取未过期的条目，不存在或已过期时返回 None"""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM ttl_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE ttl_cache SET last_access = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        conn = self._conn()
+        with conn:
+            exists = conn.execute("SELECT 1 FROM ttl_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO ttl_cache (key, value, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + ttl, now),
+            )
+        with self._lock:
+            if not exists:
+                self._count += 1
+            over = self._count > self.max_entries
+        if over:
+            self._evict()
+
+    def _evict(self) -> None:
+        """清理过期条目，仍超出上限时按最近访问时间淘汰到上限的 90%"""
+        target = int(self.max_entries * 0.9)
+        conn = self._conn()
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM ttl_cache WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            count = conn.execute("SELECT COUNT(*) FROM ttl_cache").fetchone()[0]
+            if count > target:
+                conn.execute(
+                    "DELETE FROM ttl_cache WHERE key IN "
+                    "(SELECT key FROM ttl_cache ORDER BY last_access LIMIT ?)",
+                    (count - target,),
+                )
+                count = target
+        with self._lock:
+            self._count = count
+        logger.debug("TTL 缓存淘汰完成: 过期 %d 条，剩余 %d 条", expired, count)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any],
+                       should_cache: Callable[[Any], bool] = bool) -> Any:
+        """命中时直接返回；未命中时计算并写入缓存
+
+        同一键的并发调用只有第一个真正执行 compute，其余等待它的结果（包括异常）。
+        should_cache 返回 False 的结果（默认为空结果）不写入缓存。
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            if should_cache(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_inflight": self.shared,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": self._count,
+            }